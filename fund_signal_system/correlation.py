@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from logger import logger
+
+
+def build_return_matrix(returns_by_fund, window=250):
+    """把各基金日增长率对齐成收益率矩阵
+
+    returns_by_fund: {基金代码: 以净值日期为索引的日增长率%序列}
+    返回(基金代码列表, 行为日期、列为基金的float32矩阵)，缺失值为NaN
+    """
+    codes = [code for code, returns in returns_by_fund.items() if returns is not None and len(returns) > 0]
+    if not codes:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    dates = pd.DatetimeIndex([])
+    for code in codes:
+        dates = dates.union(returns_by_fund[code].index)
+    dates = dates[-window:]
+
+    matrix = np.full((len(dates), len(codes)), np.nan, dtype=np.float32)
+    for j, code in enumerate(codes):
+        returns = returns_by_fund[code]
+        returns = returns[~returns.index.duplicated(keep='last')]
+        matrix[:, j] = returns.reindex(dates).to_numpy(dtype=np.float32)
+    return codes, matrix
+
+
+def _standardize(matrix, min_periods):
+    """按列用全窗口均值和标准差缩放，缺失值置0，返回(缩放后矩阵, 有效值掩码)
+
+    缩放只用于减小后续求和的数值误差，相关系数在两两重叠日期上另行计算，不依赖这里的均值和标准差。
+    """
+    mask = ~np.isnan(matrix)
+    counts = mask.sum(axis=0)
+    filled = np.where(mask, matrix, 0).astype(np.float32)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = filled.sum(axis=0) / counts
+        centered = np.where(mask, filled - means, 0).astype(np.float32)
+        stds = np.sqrt((centered ** 2).sum(axis=0) / (counts - 1))
+        z = centered / stds
+
+    # 数据太少或净值不波动（如货币基金）的基金不参与相关性计算
+    invalid = (counts < min_periods) | ~np.isfinite(stds) | (stds == 0)
+    z[:, invalid] = 0
+    mask[:, invalid] = False
+    return z.astype(np.float32), mask.astype(np.float32)
+
+
+def iter_correlated_pairs(matrix, threshold=0.95, memory_budget_mb=256, min_periods=60):
+    """分块计算两两相关系数，依次产出相关系数不低于阈值的(i, j, 相关系数)，i < j
+
+    每次只计算一个行块与其后全部基金的相关系数，块大小由内存预算决定，
+    不会构造完整的N×N相关矩阵。均值和方差只在两只基金都有数据的日期上计算，
+    与pandas的两两Pearson相关系数一致，新基金、使用快照的基金和节假日不同的基金也不会偏差。
+    """
+    n_funds = matrix.shape[1]
+    if n_funds < 2:
+        return
+
+    z, mask = _standardize(matrix, min_periods)
+    z_squared = z ** 2
+
+    # 每个块需要重叠天数、Σx、Σy、Σx²、Σy²、Σxy六个float64数组（各由一个float32矩阵乘积转换），
+    # 相关系数一个float64数组和比较结果，每个都是 块行数×N
+    budget_bytes = memory_budget_mb * 1024 * 1024 - z.nbytes - z_squared.nbytes - mask.nbytes
+    bytes_per_row = n_funds * (7 * 8 + 4 + 1)
+    block_size = int(budget_bytes // bytes_per_row) if budget_bytes > 0 else 1
+    if budget_bytes <= 0:
+        logger.warning(f"收益率矩阵已超过内存预算{memory_budget_mb}MB，按单行分块计算")
+    block_size = max(1, min(block_size, n_funds))
+    logger.info(f"分块计算相关系数：基金{n_funds}个，块大小{block_size}行")
+
+    for start in range(0, n_funds, block_size):
+        stop = min(start + block_size, n_funds)
+        # 只计算上三角部分：当前块与其后的全部基金，各项求和只包含两只基金都有数据的日期
+        block_z, block_mask = z[:, start:stop].T, mask[:, start:stop].T
+        overlap = (block_mask @ mask[:, start:]).astype(np.float64)
+        sum_x = (block_z @ mask[:, start:]).astype(np.float64)
+        sum_y = (block_mask @ z[:, start:]).astype(np.float64)
+        sum_xx = (z_squared[:, start:stop].T @ mask[:, start:]).astype(np.float64)
+        sum_yy = (block_mask @ z_squared[:, start:]).astype(np.float64)
+        sum_xy = (block_z @ z[:, start:]).astype(np.float64)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sum_xy - sum_x * sum_y / overlap
+            var_x = sum_xx - sum_x ** 2 / overlap
+            var_y = sum_yy - sum_y ** 2 / overlap
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[(overlap < min_periods) | (var_x <= 0) | (var_y <= 0)] = np.nan
+
+        rows, cols = np.nonzero(corr >= threshold)
+        for row, col in zip(rows, cols):
+            i, j = start + row, start + col
+            if i < j:
+                yield i, j, float(corr[row, col])
+
+
+def cluster_funds(returns_by_fund, threshold=0.95, memory_budget_mb=256, min_periods=60, window=250):
+    """按收益率相关性对基金聚类，相关系数不低于阈值的基金归为一组
+
+    每组选与组内其他基金高相关次数最多的基金作为代表，次数相同时取列表中靠前的基金。
+    返回成员数不少于2的分组列表：[{'representative': 代码, 'members': [代码, ...]}, ...]
+    """
+    codes, matrix = build_return_matrix(returns_by_fund, window)
+    n_funds = len(codes)
+    if n_funds < 2:
+        return []
+
+    # 并查集合并高相关基金
+    parent = list(range(n_funds))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    degree = np.zeros(n_funds, dtype=np.int64)
+    pair_count = 0
+    for i, j, _ in iter_correlated_pairs(matrix, threshold, memory_budget_mb, min_periods):
+        degree[i] += 1
+        degree[j] += 1
+        pair_count += 1
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(n_funds):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        representative = max(members, key=lambda i: (degree[i], -i))
+        clusters.append({
+            'representative': codes[representative],
+            'members': [codes[i] for i in members]
+        })
+    clusters.sort(key=lambda c: len(c['members']), reverse=True)
+
+    logger.info(f"相关性聚类完成：高相关基金对{pair_count}个，相似基金组{len(clusters)}个")
+    return clusters
@@ -3,8 +3,10 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import os
+import json
 from datetime import datetime
 from logger import logger
+from timeframes import daily_rows
 
 class EmailSender:
     """邮件发送器"""
@@ -52,65 +54,196 @@ class EmailSender:
         
         logger.debug(f"最终SMTP_SERVER: '{smtp_server}'")
         
+        # SMTP_SSL=false时使用明文SMTP，仅用于本地测试服务器
+        smtp_ssl = os.environ.get('SMTP_SSL', 'true').strip().lower() not in ('0', 'false', 'no')
+        
         return {
             'smtp_server': smtp_server,
             'smtp_port': smtp_port,
+            'smtp_ssl': smtp_ssl,
             'smtp_user': os.environ.get('SMTP_USER', ''),
             'smtp_password': os.environ.get('SMTP_PASSWORD', ''),
-            'recipients': [r.strip() for r in os.environ.get('RECIPIENTS', '').split(';') if r.strip()]
+            'recipients': [r.strip() for r in os.environ.get('RECIPIENTS', '').split(';') if r.strip()],
+            'watchlists': self._load_watchlists()
         }
     
-    def send_email(self, signal_csv_path, report_date=None):
-        """发送基金信号报告邮件"""
-        if report_date is None:
-            report_date = datetime.now().strftime('%Y-%m-%d')
+    def _load_watchlists(self):
+        """加载收件人自选基金列表
         
-        logger.info(f"开始发送基金信号报告邮件，报告日期：{report_date}")
+        WATCHLISTS环境变量格式：邮箱=基金代码,基金代码;邮箱=基金代码
+        也可以用WATCHLIST_FILE指定JSON文件：{"邮箱": ["基金代码", ...]}
+        """
+        watchlists = {}
         
-        try:
-            # 检查配置
-            if not self.config['smtp_user'] or not self.config['smtp_password']:
-                logger.error("SMTP配置不完整，无法发送邮件")
-                return False
-            
-            if not self.config['recipients']:
-                logger.error("收件人列表为空，无法发送邮件")
-                return False
-            
-            # 创建邮件，明确指定subtype为mixed，支持附件
-            msg = MIMEMultipart('mixed')
-            
-            # 设置邮件主题和发件人
-            msg['Subject'] = f"📊 基金布林带策略晨报 - {report_date}"
-            msg['From'] = self.config['smtp_user']
-            msg['To'] = ','.join(self.config['recipients'])
-            
-            # 读取信号数据，生成报告概览
-            import pandas as pd
-            signal_df = pd.read_csv(signal_csv_path)
-            
-            # 统计信号
-            signal_counts = signal_df['布林带信号'].value_counts().to_dict()
-            buy_signals = signal_counts.get('买入', 0) + signal_counts.get('机会买入', 0)
-            sell_signals = signal_counts.get('卖出', 0) + signal_counts.get('提示风险', 0)
-            hold_signals = signal_counts.get('持有', 0)
-            
-            # 生成HTML格式的邮件正文
-            html_content = f"""
+        watchlist_file = os.environ.get('WATCHLIST_FILE', 'watchlists.json')
+        if watchlist_file and os.path.exists(watchlist_file):
+            try:
+                with open(watchlist_file, 'r', encoding='utf-8') as f:
+                    for recipient, codes in json.load(f).items():
+                        watchlists[recipient.strip()] = [str(code).strip().split('.')[0] for code in codes]
+            except Exception as e:
+                logger.warning(f"读取自选基金文件{watchlist_file}失败：{str(e)}")
+        
+        for entry in os.environ.get('WATCHLISTS', '').split(';'):
+            if '=' not in entry:
+                continue
+            recipient, codes = entry.split('=', 1)
+            watchlists[recipient.strip()] = [code.strip().split('.')[0] for code in codes.split(',') if code.strip()]
+        
+        if watchlists:
+            logger.info(f"已加载{len(watchlists)}个收件人的自选基金列表")
+        return watchlists
+    
+    def _build_changes_html(self, signal_changes, max_rows=50):
+        """生成较上期信号变化的HTML片段"""
+        if signal_changes is None:
+            return ""
+        
+        if signal_changes.empty:
+            return """
+                <h3 style="color: #2c3e50;">较上期信号变化</h3>
+                <div style="margin-bottom: 20px;">无信号变化</div>
+            """
+        
+        rows = []
+        for _, change in signal_changes.head(max_rows).iterrows():
+            rows.append(
+                f"<tr><td>{change['基金代码']}</td><td>{change['基金简称']}</td><td>{change['指标']}</td>"
+                f"<td>{change['原信号']} → {change['新信号']}</td><td>{change['净值日期']}</td></tr>"
+            )
+        more = ""
+        if len(signal_changes) > max_rows:
+            more = f"<p>另有{len(signal_changes) - max_rows}条变化，详见附件</p>"
+        
+        return f"""
+                <h3 style="color: #2c3e50;">较上期信号变化（{len(signal_changes)}条）</h3>
+                <div style="margin-bottom: 20px;">
+                    <table border="1" cellspacing="0" cellpadding="4" style="border-collapse: collapse;">
+                        <tr><th>基金代码</th><th>基金简称</th><th>指标</th><th>信号变化</th><th>净值日期</th></tr>
+                        {''.join(rows)}
+                    </table>
+                    {more}
+                </div>
+        """
+    
+    def _build_clusters_html(self, fund_clusters, max_clusters=20):
+        """生成相似基金分组的HTML片段"""
+        if not fund_clusters:
+            return ""
+        
+        rows = []
+        for cluster in fund_clusters[:max_clusters]:
+            names = cluster.get('names', {})
+            representative = cluster['representative']
+            others = [f"{code} {names.get(code, '')}" for code in cluster['members'] if code != representative]
+            rows.append(
+                f"<tr><td>{representative} {names.get(representative, '')}</td>"
+                f"<td>{len(cluster['members'])}</td><td>{'、'.join(others)}</td></tr>"
+            )
+        more = ""
+        if len(fund_clusters) > max_clusters:
+            more = f"<p>另有{len(fund_clusters) - max_clusters}组相似基金未列出</p>"
+        
+        return f"""
+                <h3 style="color: #2c3e50;">相似基金分组（{len(fund_clusters)}组）</h3>
+                <div style="margin-bottom: 20px;">
+                    <p>以下各组基金日收益率高度相关，持仓可能相近，每组关注代表基金即可</p>
+                    <table border="1" cellspacing="0" cellpadding="4" style="border-collapse: collapse;">
+                        <tr><th>代表基金</th><th>基金数</th><th>同组基金</th></tr>
+                        {''.join(rows)}
+                    </table>
+                    {more}
+                </div>
+        """
+    
+    def _build_rankings_html(self, fund_rankings):
+        """生成各投资类型综合评分前后N名的HTML片段"""
+        if not fund_rankings:
+            return ""
+        
+        def fund_rows(funds):
+            return ''.join(
+                f"<tr><td>{int(fund['综合排名'])}/{int(fund['同类基金数'])}</td><td>{fund['基金代码']}</td>"
+                f"<td>{fund['基金简称']}</td><td>{fund['综合评分']:.2f}</td><td>{fund['布林带信号']}</td></tr>"
+                for _, fund in funds.iterrows()
+            )
+        
+        sections = []
+        for invest_type, (top, bottom) in fund_rankings.items():
+            bottom_rows = ""
+            if not bottom.empty:
+                bottom_rows = f"""<tr><td colspan="5" style="color: #e74c3c;">评分最低</td></tr>{fund_rows(bottom)}"""
+            sections.append(f"""
+                    <h4 style="color: #34495e;">{invest_type}</h4>
+                    <table border="1" cellspacing="0" cellpadding="4" style="border-collapse: collapse;">
+                        <tr><th>同类排名</th><th>基金代码</th><th>基金简称</th><th>综合评分</th><th>布林带信号</th></tr>
+                        <tr><td colspan="5" style="color: #27ae60;">评分最高</td></tr>
+                        {fund_rows(top)}
+                        {bottom_rows}
+                    </table>""")
+        
+        return f"""
+                <h3 style="color: #2c3e50;">综合评分排名</h3>
+                <div style="margin-bottom: 20px;">
+                    <p>综合评分由RSI、CCI、MACD和布林带位置合成，范围-100~100，越高越接近超卖/买入区间</p>
+                    {''.join(sections)}
+                </div>
+        """
+    
+    def check_config(self):
+        """检查SMTP配置和收件人是否完整"""
+        if not self.config['smtp_user'] or not self.config['smtp_password']:
+            logger.error("SMTP配置不完整，无法发送邮件")
+            return False
+        
+        if not self.config['recipients']:
+            logger.error("收件人列表为空，无法发送邮件")
+            return False
+        
+        return True
+    
+    def build_report_message(self, signal_df, report_date, recipients, attachment_bytes, attachment_name,
+                             signal_changes=None, fund_clusters=None, fund_rankings=None, title="基金布林带策略晨报",
+                             report_notes=None):
+        """根据内存中的信号数据生成报告邮件，report_notes为报告概览中附加的说明"""
+        # 创建邮件，明确指定subtype为mixed，支持附件
+        msg = MIMEMultipart('mixed')
+        
+        # 设置邮件主题和发件人
+        msg['Subject'] = f"📊 {title} - {report_date}"
+        msg['From'] = self.config['smtp_user']
+        msg['To'] = ','.join(recipients)
+        
+        # 统计信号，多周期模式下只统计日线信号
+        signal_df = daily_rows(signal_df)
+        signal_counts = signal_df['布林带信号'].value_counts().to_dict() if '布林带信号' in signal_df.columns else {}
+        buy_signals = signal_counts.get('买入', 0) + signal_counts.get('机会买入', 0)
+        sell_signals = signal_counts.get('卖出', 0) + signal_counts.get('提示风险', 0)
+        hold_signals = signal_counts.get('持有', 0)
+        fund_count = signal_df['基金代码'].nunique() if '基金代码' in signal_df.columns else 0
+        notes_html = ''.join(f"<li>{note}</li>" for note in report_notes or [])
+        if notes_html:
+            notes_html = f"<strong>说明：</strong><ul>{notes_html}</ul>"
+        
+        # 生成HTML格式的邮件正文
+        html_content = f"""
             <html>
             <body style="font-family: Arial, sans-serif;">
-                <h2 style="color: #2c3e50;">📊 基金布林带策略晨报</h2>
+                <h2 style="color: #2c3e50;">📊 {title}</h2>
                 <div style="margin-bottom: 20px;">
                     <strong>报告日期：</strong>{report_date}<br>
-                    <strong>分析基金数：</strong>{signal_df['基金代码'].nunique()}<br>
+                    <strong>分析基金数：</strong>{fund_count}<br>
                     <strong>信号分布：</strong>
                     <ul>
                         <li>买入信号：<span style="color: #27ae60;">{buy_signals}个</span></li>
                         <li>卖出信号：<span style="color: #e74c3c;">{sell_signals}个</span></li>
                         <li>持有信号：<span style="color: #f39c12;">{hold_signals}个</span></li>
                     </ul>
+                    {notes_html}
                 </div>
-                
+                {self._build_rankings_html(fund_rankings)}
+                {self._build_changes_html(signal_changes)}
+                {self._build_clusters_html(fund_clusters)}
                 <h3 style="color: #2c3e50;">操作建议</h3>
                 <div style="margin-bottom: 20px;">
                     <ol>
@@ -133,11 +266,49 @@ class EmailSender:
             </body>
             </html>
             """
-            
-            # 添加正文，明确设置为内联内容
-            html_part = MIMEText(html_content, 'html', 'utf-8')
-            html_part.add_header('Content-Disposition', 'inline')
-            msg.attach(html_part)
+        
+        # 添加正文，明确设置为内联内容
+        html_part = MIMEText(html_content, 'html', 'utf-8')
+        html_part.add_header('Content-Disposition', 'inline')
+        msg.attach(html_part)
+        
+        # 添加附件，使用MIMEApplication处理，确保所有邮件客户端都能正确显示
+        attachment = MIMEApplication(attachment_bytes)
+        # 明确设置Content-Disposition和文件名
+        attachment.add_header('Content-Disposition', 'attachment', filename=("utf-8", "", attachment_name))
+        attachment.add_header('Content-Type', 'text/csv', charset='utf-8')
+        msg.attach(attachment)
+        logger.info(f"附件成功添加到邮件：{attachment_name}")
+        
+        return msg
+    
+    def open_connection(self):
+        """连接并登录SMTP服务器，返回连接对象；SMTP_SSL=false时使用明文SMTP（用于本地测试服务器）"""
+        logger.info(f"连接SMTP服务器：{self.config['smtp_server']}:{self.config['smtp_port']}")
+        if self.config['smtp_ssl']:
+            server = smtplib.SMTP_SSL(self.config['smtp_server'], self.config['smtp_port'], timeout=30)
+        else:
+            server = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'], timeout=30)
+        logger.debug("SMTP服务器连接成功")
+        
+        if self.config['smtp_ssl'] or server.has_extn('auth'):
+            logger.debug(f"登录SMTP服务器：{self.config['smtp_user']}")
+            server.login(self.config['smtp_user'], self.config['smtp_password'])
+            logger.debug("SMTP服务器登录成功")
+        return server
+    
+    def send_email(self, signal_csv_path, report_date=None, signal_changes=None, fund_clusters=None,
+                   fund_rankings=None, report_notes=None):
+        """发送基金信号报告邮件"""
+        if report_date is None:
+            report_date = datetime.now().strftime('%Y-%m-%d')
+        
+        logger.info(f"开始发送基金信号报告邮件，报告日期：{report_date}")
+        
+        try:
+            # 检查配置
+            if not self.check_config():
+                return False
             
             # 检查附件文件是否存在且不为空
             logger.info(f"尝试添加附件：{signal_csv_path}")
@@ -157,29 +328,21 @@ class EmailSender:
             
             logger.info(f"附件文件存在，大小：{file_size}字节")
             
-            # 添加附件，使用MIMEApplication处理，确保所有邮件客户端都能正确显示
-            try:
-                with open(abs_signal_csv_path, 'rb') as f:
-                    attachment = MIMEApplication(f.read())
-                    filename = os.path.basename(abs_signal_csv_path)
-                    logger.info(f"添加附件：{filename}")
-                    # 明确设置Content-Disposition和文件名
-                    attachment.add_header('Content-Disposition', 'attachment', filename=("utf-8", "", filename))
-                    attachment.add_header('Content-Type', 'text/csv', charset='utf-8')
-                    msg.attach(attachment)
-                    logger.info(f"附件成功添加到邮件：{filename}")
-            except Exception as e:
-                logger.error(f"添加附件时出错：{str(e)}")
-                return False
+            # 读取信号数据，生成报告概览
+            import pandas as pd
+            signal_df = pd.read_csv(signal_csv_path)
+            with open(abs_signal_csv_path, 'rb') as f:
+                attachment_bytes = f.read()
             
-            # 发送邮件
-            logger.info(f"连接SMTP服务器：{self.config['smtp_server']}:{self.config['smtp_port']}")
-            server = smtplib.SMTP_SSL(self.config['smtp_server'], self.config['smtp_port'])
-            logger.debug("SMTP服务器连接成功")
+            msg = self.build_report_message(
+                signal_df, report_date, self.config['recipients'],
+                attachment_bytes, os.path.basename(abs_signal_csv_path),
+                signal_changes=signal_changes, fund_clusters=fund_clusters, fund_rankings=fund_rankings,
+                report_notes=report_notes
+            )
             
-            logger.debug(f"登录SMTP服务器：{self.config['smtp_user']}")
-            server.login(self.config['smtp_user'], self.config['smtp_password'])
-            logger.debug("SMTP服务器登录成功")
+            # 发送邮件
+            server = self.open_connection()
             
             logger.debug(f"发送邮件给：{','.join(self.config['recipients'])}")
             server.send_message(msg)
@@ -200,8 +363,7 @@ class EmailSender:
         """测试SMTP连接"""
         try:
             logger.info("测试SMTP连接")
-            server = smtplib.SMTP_SSL(self.config['smtp_server'], self.config['smtp_port'])
-            server.login(self.config['smtp_user'], self.config['smtp_password'])
+            server = self.open_connection()
             server.quit()
             logger.info("SMTP连接测试成功")
             return True
@@ -0,0 +1,127 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+import akshare as ak
+import pandas as pd
+from logger import logger
+
+# 净值按北京时间公布，运行环境（如GitHub Actions）的本地时区可能是UTC；中国不实行夏令时，使用固定偏移
+MARKET_TZ = timezone(timedelta(hours=8), 'Asia/Shanghai')
+
+
+class TradingCalendar:
+    """交易日历，缓存在 data/trade_calendar.csv
+
+    新浪交易日历包含当年全部交易日，缓存覆盖不到当天时才重新请求。
+    """
+
+    # 基金净值一般在交易日晚间公布，该时刻之后才认为当日净值已公布
+    NAV_PUBLISH_HOUR = 21
+
+    def __init__(self, cache_path=None):
+        """初始化交易日历"""
+        if cache_path is None:
+            cache_path = os.path.join(os.getcwd(), 'data', 'trade_calendar.csv')
+        self.cache_path = cache_path
+        self._dates = None
+
+    def load(self):
+        """加载交易日历，返回排序后的日期字符串列表，获取失败时返回None"""
+        if self._dates is not None:
+            return self._dates
+
+        today = datetime.now(MARKET_TZ).strftime('%Y-%m-%d')
+        cached = None
+        if os.path.exists(self.cache_path):
+            try:
+                cached = pd.read_csv(self.cache_path, dtype=str)['trade_date'].tolist()
+            except Exception as e:
+                logger.warning(f"读取交易日历缓存失败：{str(e)}")
+
+        if cached and cached[-1] >= today:
+            self._dates = cached
+            return self._dates
+
+        try:
+            logger.info("开始更新交易日历")
+            calendar_df = ak.tool_trade_date_hist_sina()
+            dates = sorted(pd.to_datetime(calendar_df['trade_date']).dt.strftime('%Y-%m-%d'))
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            pd.DataFrame({'trade_date': dates}).to_csv(self.cache_path, index=False)
+            logger.info(f"交易日历已更新，共{len(dates)}个交易日，最后交易日：{dates[-1]}")
+            self._dates = dates
+        except Exception as e:
+            logger.warning(f"获取交易日历失败：{str(e)}")
+            # 缓存过期时仍可用于判断缓存范围内的日期
+            self._dates = cached
+        return self._dates
+
+    def expected_nav_date(self, now=None):
+        """当前时刻应已公布净值的最近交易日，交易日历不可用时返回None
+
+        now 为不带时区的时间时视为北京时间，带时区时先转换为北京时间。
+        """
+        dates = self.load()
+        if not dates:
+            return None
+
+        if now is None:
+            now = datetime.now(MARKET_TZ)
+        elif now.tzinfo is not None:
+            now = now.astimezone(MARKET_TZ)
+        latest = now if now.hour >= self.NAV_PUBLISH_HOUR else now - timedelta(days=1)
+        latest = latest.strftime('%Y-%m-%d')
+        if latest > dates[-1]:
+            return None
+
+        candidates = [d for d in dates if d <= latest]
+        return candidates[-1] if candidates else None
+
+
+class RunState:
+    """运行状态，记录每种运行模式最近一次成功报告，保存在 data/run_state.json"""
+
+    def __init__(self, state_path=None):
+        """初始化运行状态"""
+        if state_path is None:
+            state_path = os.path.join(os.getcwd(), 'data', 'run_state.json')
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取运行状态失败：{str(e)}")
+
+    def get(self, mode):
+        """获取某种运行模式最近一次成功报告的状态"""
+        return self.state.get(mode, {})
+
+    def save(self, mode, report_date, nav_date, fund_count):
+        """记录一次成功报告"""
+        self.state[mode] = {
+            'report_date': report_date,
+            'nav_date': nav_date,
+            'fund_count': fund_count,
+            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+
+def select_changed_funds(fund_codes, available_dates, processed_dates):
+    """选出有新净值的基金：可用净值日期晚于上次处理的净值日期，或从未处理过
+
+    available_dates 未包含的基金无法判断是否更新，按有更新处理。
+    """
+    changed = []
+    for code in fund_codes:
+        processed = processed_dates.get(code)
+        available = available_dates.get(code)
+        if processed is None or available is None or available > processed:
+            changed.append(code)
+    return changed
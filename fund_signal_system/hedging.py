@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logger import logger
+
+
+class LatencyTracker:
+    """按接口统计请求耗时直方图，保存在 data/latency_stats.json
+
+    对冲阈值取历史耗时的分位数（默认p90），每次运行后保存，
+    样本数超过上限时整体减半，使阈值随近期网络状况逐步调整。
+    """
+
+    # 直方图分桶上界（秒），最后一个桶收集更慢的请求
+    BUCKETS = [0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60]
+    MAX_SAMPLES = 5000
+    # 样本不足时使用的默认阈值和阈值上下限（秒）
+    MIN_SAMPLES = 20
+    DEFAULT_THRESHOLD = 3.0
+    MIN_THRESHOLD = 0.3
+    MAX_THRESHOLD = 15.0
+
+    def __init__(self, stats_path=None, quantile=0.9):
+        """初始化耗时统计，加载历史直方图"""
+        if stats_path is None:
+            stats_path = os.path.join(os.getcwd(), 'data', 'latency_stats.json')
+        self.stats_path = stats_path
+        self.quantile = quantile
+        self._lock = threading.Lock()
+        self.stats = {}
+        if os.path.exists(stats_path):
+            try:
+                with open(stats_path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取请求耗时统计失败：{str(e)}")
+        # 本次运行的统计，用于运行结束时输出
+        self.run_stats = {}
+
+    def _empty(self):
+        return {'counts': [0] * (len(self.BUCKETS) + 1), 'failures': 0}
+
+    def record(self, endpoint, seconds, ok=True):
+        """记录一次请求耗时，失败的请求只计数"""
+        index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        with self._lock:
+            for stats in (self.stats, self.run_stats):
+                entry = stats.setdefault(endpoint, self._empty())
+                if ok:
+                    entry['counts'][index] += 1
+                else:
+                    entry['failures'] += 1
+
+            entry = self.stats[endpoint]
+            if sum(entry['counts']) > self.MAX_SAMPLES:
+                entry['counts'] = [count // 2 for count in entry['counts']]
+                entry['failures'] //= 2
+
+    def percentile(self, endpoint, quantile, stats=None):
+        """按直方图估算耗时分位数（取所在桶的上界），样本不足时返回None"""
+        entry = (stats if stats is not None else self.stats).get(endpoint)
+        if entry is None:
+            return None
+        total = sum(entry['counts'])
+        if total == 0:
+            return None
+
+        target = quantile * total
+        cumulative = 0
+        for i, count in enumerate(entry['counts']):
+            cumulative += count
+            if cumulative >= target:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else self.BUCKETS[-1] * 2
+        return self.BUCKETS[-1] * 2
+
+    def threshold(self, endpoint):
+        """对冲阈值：历史耗时分位数，限制在上下限之间"""
+        entry = self.stats.get(endpoint)
+        if entry is None or sum(entry['counts']) < self.MIN_SAMPLES:
+            return self.DEFAULT_THRESHOLD
+        value = self.percentile(endpoint, self.quantile)
+        return min(max(value, self.MIN_THRESHOLD), self.MAX_THRESHOLD)
+
+    def timed(self, endpoint, func):
+        """调用func并记录耗时"""
+        start = time.time()
+        try:
+            result = func()
+        except Exception:
+            self.record(endpoint, time.time() - start, ok=False)
+            raise
+        self.record(endpoint, time.time() - start)
+        return result
+
+    def log_summary(self):
+        """输出本次运行各接口的耗时直方图和分位数"""
+        for endpoint, entry in self.run_stats.items():
+            total = sum(entry['counts'])
+            logger.info(f"接口{endpoint}耗时统计：成功{total}次，失败{entry['failures']}次，"
+                        f"p50={self.percentile(endpoint, 0.5, self.run_stats)}秒，"
+                        f"p90={self.percentile(endpoint, 0.9, self.run_stats)}秒，"
+                        f"p99={self.percentile(endpoint, 0.99, self.run_stats)}秒，"
+                        f"下次对冲阈值={self.threshold(endpoint)}秒")
+            bounds = [f"≤{bound}s" for bound in self.BUCKETS] + [f">{self.BUCKETS[-1]}s"]
+            histogram = ', '.join(f"{bound}:{count}" for bound, count in zip(bounds, entry['counts']) if count)
+            logger.info(f"接口{endpoint}耗时直方图：{histogram}")
+
+    def save(self):
+        """保存耗时统计"""
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            tmp_path = f'{self.stats_path}.tmp'
+            with self._lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.stats, f)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            logger.warning(f"保存请求耗时统计失败：{str(e)}")
+
+
+class HedgedFetcher:
+    """对冲请求
+
+    主请求超过对冲阈值仍未返回时并行发起一个重复请求，先返回有效结果的请求胜出；
+    请求失败时立即（按退避间隔）补发，最多发起max_attempts个请求。
+    落后的请求在后台完成后只记录耗时，结果丢弃。
+    """
+
+    def __init__(self, tracker, max_workers=None, max_attempts=3, base_delay=1):
+        """初始化对冲请求执行器
+
+        前面基金落后的请求仍会占用线程，线程数默认为max_attempts的4倍，
+        使新基金的请求不必排队等待空闲线程。
+        """
+        self.tracker = tracker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        if max_workers is None:
+            max_workers = max_attempts * 4
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-fetch')
+        self.hedge_count = 0
+        self.hedge_wins = 0
+
+    def _submit(self, endpoint, func):
+        # 在线程中开始执行时才计时，排队等待线程的时间不计入接口耗时
+        return self.executor.submit(self.tracker.timed, endpoint, func)
+
+    @staticmethod
+    def is_valid(result):
+        """结果有效：非空DataFrame"""
+        return result is not None and not getattr(result, 'empty', False)
+
+    def fetch(self, endpoint, func, label=''):
+        """执行对冲请求，返回第一个有效结果；没有有效结果且有请求返回空数据时返回None，全部请求失败时抛出最后一个异常"""
+        threshold = self.tracker.threshold(endpoint)
+        futures = {self._submit(endpoint, func): 1}
+        pending = set(futures)
+        last_error = None
+        failures = 0
+        empty = False
+
+        while pending:
+            done, pending = wait(pending, timeout=threshold, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    failures += 1
+                    logger.warning(f"{label}第{futures[future]}个请求失败：{str(e)}")
+                    continue
+                if not self.is_valid(result):
+                    # 空数据时继续等待其他在途请求，没有在途请求时才返回None
+                    empty = True
+                    logger.warning(f"{label}第{futures[future]}个请求返回空数据")
+                    continue
+                if futures[future] > 1:
+                    self.hedge_wins += 1
+                    logger.info(f"{label}第{futures[future]}个请求先返回")
+                return result
+
+            # 接口正常返回过空数据时不再重试，由调用方使用备选方案
+            if empty and not pending:
+                return None
+
+            if len(futures) >= self.max_attempts:
+                continue
+
+            if not done:
+                # 超过阈值仍未返回，并行发起重复请求
+                self.hedge_count += 1
+                logger.info(f"{label}请求超过{threshold}秒未返回，发起对冲请求")
+            elif not pending:
+                # 全部在途请求都已失败，按退避间隔补发
+                delay = self.base_delay * (2 ** (failures - 1)) + random.uniform(0, 1)
+                logger.warning(f"{label}{delay:.2f}秒后重试")
+                time.sleep(delay)
+            else:
+                continue
+
+            future = self._submit(endpoint, func)
+            futures[future] = len(futures) + 1
+            pending.add(future)
+
+        if last_error is not None:
+            raise last_error
+        return None
+
+    def log_summary(self):
+        """输出对冲统计"""
+        if self.hedge_count:
+            logger.info(f"本次运行发起对冲请求{self.hedge_count}次，非首个请求胜出{self.hedge_wins}次")
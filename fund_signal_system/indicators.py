@@ -0,0 +1,324 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from logger import logger
+from scoring import add_composite_score
+
+
+def _group_positions(codes):
+    """返回每行在所属基金内的序号（数据需已按基金代码排序）"""
+    starts = np.r_[True, codes[1:] != codes[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(codes)), 0))
+    return np.arange(len(codes)) - group_start
+
+
+def rolling_mean_abs_dev(values, positions, window=20, chunk_rows=200000):
+    """分组滚动平均绝对偏差，与 rolling(window, min_periods=1).apply(mean|x-mean(x)|) 等价
+
+    positions 为每行在所属基金内的序号，用于屏蔽跨越基金边界的窗口；按块计算以控制内存。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    padded = np.r_[np.full(window - 1, np.nan), values]
+    result = np.empty(len(values), dtype=np.float64)
+    offsets = np.arange(window) - (window - 1)
+
+    for start in range(0, len(values), chunk_rows):
+        stop = min(start + chunk_rows, len(values))
+        windows = sliding_window_view(padded[start:stop + window - 1], window).copy()
+        # 窗口内早于本基金第一条数据的位置置为NaN
+        windows[offsets[None, :] < -positions[start:stop, None]] = np.nan
+        with np.errstate(invalid='ignore'):
+            means = np.nanmean(windows, axis=1)
+            result[start:stop] = np.nanmean(np.abs(windows - means[:, None]), axis=1)
+    return result
+
+
+class ComputeContext:
+    """一次指标计算的上下文
+
+    提供按基金分组的滚动、指数平均、差分和平移运算（单个基金时不分组），
+    并缓存已计算的中间量，保证同一中间量只计算一次。
+    """
+
+    def __init__(self, df, engine, group_key=None):
+        self.df = df
+        self.engine = engine
+        self.group_key = group_key
+        self.cache = {}
+        self._positions = None
+
+    def _groupby(self, series):
+        return series.groupby(self.df[self.group_key], sort=False)
+
+    def get(self, name):
+        """获取中间量，未计算时先计算其依赖"""
+        if name not in self.cache:
+            intermediate = self.engine.intermediates[name]
+            for dependency in intermediate.inputs:
+                self.get(dependency)
+            self.cache[name] = intermediate.compute(self)
+        return self.cache[name]
+
+    def rolling_mean(self, series, window):
+        if self.group_key is None:
+            return series.rolling(window=window, min_periods=1).mean()
+        return self._groupby(series).rolling(window=window, min_periods=1).mean().reset_index(level=0, drop=True)
+
+    def rolling_std(self, series, window):
+        if self.group_key is None:
+            return series.rolling(window=window, min_periods=1).std()
+        return self._groupby(series).rolling(window=window, min_periods=1).std().reset_index(level=0, drop=True)
+
+    def rolling_mad(self, series, window):
+        if self._positions is None:
+            if self.group_key is None:
+                self._positions = np.arange(len(series))
+            else:
+                self._positions = _group_positions(self.df[self.group_key].to_numpy())
+        return pd.Series(rolling_mean_abs_dev(series.to_numpy(), self._positions, window), index=series.index)
+
+    def ewm_mean(self, series, span):
+        if self.group_key is None:
+            return series.ewm(span=span, adjust=False).mean()
+        return self._groupby(series).ewm(span=span, adjust=False).mean().reset_index(level=0, drop=True)
+
+    def diff(self, series):
+        return series.diff() if self.group_key is None else self._groupby(series).diff()
+
+    def shift(self, series):
+        return series.shift(1) if self.group_key is None else self._groupby(series).shift(1)
+
+
+class Intermediate:
+    """共享中间量，如滚动均值、滚动标准差、差分，多个指标使用时只计算一次"""
+
+    def __init__(self, name, inputs, lookback, compute):
+        self.name = name
+        self.inputs = list(inputs)
+        self.lookback = lookback
+        self.compute = compute
+
+
+class Indicator:
+    """技术指标
+
+    inputs 为依赖的中间量或其他指标名称，lookback 为需要的历史条数，
+    outputs 为写入数据的列，compute(df, ctx) 计算并写入这些列；
+    fallback(df) 可选，基金数据少于lookback条时生成基础信号。
+    """
+
+    def __init__(self, name, inputs, lookback, outputs, compute, fallback=None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.lookback = lookback
+        self.outputs = list(outputs)
+        self.compute = compute
+        self.fallback = fallback
+
+
+class IndicatorEngine:
+    """指标注册表和计算引擎：按依赖关系解析请求的指标，共享中间量，只计算请求的指标"""
+
+    def __init__(self):
+        self.intermediates = {}
+        self.indicators = {}
+
+    def register_intermediate(self, intermediate):
+        """注册中间量"""
+        self.intermediates[intermediate.name] = intermediate
+        return intermediate
+
+    def register(self, indicator):
+        """注册指标，同名指标会被替换"""
+        for name in indicator.inputs:
+            if name not in self.intermediates and name not in self.indicators:
+                raise ValueError(f"指标{indicator.name}依赖的{name}未注册")
+        self.indicators[indicator.name] = indicator
+        return indicator
+
+    def resolve(self, names=None):
+        """解析请求的指标及其依赖的指标，按依赖顺序返回"""
+        if names is None:
+            names = list(self.indicators)
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name not in self.indicators:
+                raise ValueError(f"未注册的指标：{name}")
+            if name in visiting:
+                raise ValueError(f"指标依赖存在循环：{name}")
+            visiting.add(name)
+            for dependency in self.indicators[name].inputs:
+                if dependency in self.indicators:
+                    visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in names:
+            visit(name)
+        return [self.indicators[name] for name in ordered]
+
+    def lookback(self, names=None):
+        """请求的指标需要的最长历史条数"""
+        return max((indicator.lookback for indicator in self.resolve(names)), default=0)
+
+    def compute(self, df, names=None, group_key=None, min_rows=20):
+        """计算请求的指标
+
+        group_key 为None时df为单个基金按日期排序的数据；否则按该列分组一次性计算多只基金。
+        数据少于某个指标声明的lookback条（且不少于min_rows条）的基金，该指标使用基础信号。
+        """
+        indicators = self.resolve(names)
+        ctx = ComputeContext(df, self, group_key)
+
+        if group_key is None:
+            sizes = pd.Series(len(df), index=df.index)
+        else:
+            sizes = df.groupby(group_key, sort=False)[df.columns[0]].transform('size')
+
+        for indicator in indicators:
+            short = sizes < max(min_rows, indicator.lookback)
+            if indicator.fallback is not None and short.all():
+                # 全部数据不足时只生成基础信号
+                indicator.fallback(df)
+                continue
+
+            indicator.compute(df, ctx)
+            logger.debug(f"指标{indicator.name}计算完成")
+
+            if indicator.fallback is not None and short.any():
+                # 数据不足的基金改用基础信号
+                basic = df.loc[short].copy()
+                indicator.fallback(basic)
+                df.loc[short, indicator.outputs] = basic[indicator.outputs]
+        return df
+
+
+def _cross_signal(df, ctx, column, up_level, down_level, signal_column):
+    """数值上穿up_level为买入，下穿down_level为卖出"""
+    previous = ctx.shift(df[column])
+    df[signal_column] = '持有'
+    df.loc[(df[column] > up_level) & (previous <= up_level), signal_column] = '买入'
+    df.loc[(df[column] < down_level) & (previous >= down_level), signal_column] = '卖出'
+
+
+def _compute_ma(df, ctx):
+    df['MA5'] = ctx.get('ma5')
+    df['MA10'] = ctx.get('ma10')
+    ma5_prev, ma10_prev = ctx.shift(df['MA5']), ctx.shift(df['MA10'])
+    df['均线信号'] = '持有'
+    df.loc[(df['MA5'] > df['MA10']) & (ma5_prev <= ma10_prev), '均线信号'] = '买入'
+    df.loc[(df['MA5'] < df['MA10']) & (ma5_prev >= ma10_prev), '均线信号'] = '卖出'
+
+
+def _fallback_ma(df):
+    df['均线信号'] = '持有'
+
+
+def _compute_rsi(df, ctx):
+    rs = ctx.get('gain14') / ctx.get('loss14')
+    df['RSI'] = (100 - (100 / (1 + rs))).round(2).fillna(50)
+    _cross_signal(df, ctx, 'RSI', 30, 70, 'RSI信号')
+
+
+def _fallback_rsi(df):
+    df['RSI'] = 50  # 默认RSI值
+    df['RSI信号'] = '持有'
+
+
+def _compute_macd(df, ctx):
+    df['MACD'] = (ctx.get('ema12') - ctx.get('ema26')).round(4)
+    df['MACD_signal'] = ctx.ewm_mean(df['MACD'], 9)
+    df['macd值'] = df['MACD']
+    _cross_signal(df, ctx, 'MACD', -100, 100, 'macd信号')
+
+
+def _fallback_macd(df):
+    df['MACD'] = 0  # 默认MACD值
+    df['macd值'] = 0
+    df['macd信号'] = '持有'
+
+
+def _compute_cci(df, ctx):
+    df['cci值'] = ((ctx.get('nav') - ctx.get('ma20')) / (0.015 * ctx.get('mad20'))).round(2).fillna(0)
+    _cross_signal(df, ctx, 'cci值', -100, 100, 'cci信号')
+
+
+def _fallback_cci(df):
+    df['cci值'] = 0  # 默认CCI值
+    df['cci信号'] = '持有'
+
+
+def _compute_boll(df, ctx):
+    nav, ma20, std20 = ctx.get('nav'), ctx.get('ma20'), ctx.get('std20')
+    df['布林带中轨值'] = ma20
+    df['布林带上轨值'] = (ma20 + 2 * std20).round(4)
+    df['布林带下轨值'] = (ma20 - 2 * std20).round(4)
+    nav_prev = ctx.get('nav_prev')
+    lower_prev, upper_prev = ctx.shift(df['布林带下轨值']), ctx.shift(df['布林带上轨值'])
+    df['布林带信号'] = '持有'
+    df.loc[nav < df['布林带下轨值'], '布林带信号'] = '机会买入'
+    df.loc[nav > df['布林带上轨值'], '布林带信号'] = '提示风险'
+    df.loc[(nav > df['布林带下轨值']) & (nav_prev <= lower_prev), '布林带信号'] = '买入'
+    df.loc[(nav < df['布林带上轨值']) & (nav_prev >= upper_prev), '布林带信号'] = '卖出'
+
+
+def _fallback_boll(df):
+    df['布林带中轨值'] = df['最新净值']
+    df['布林带上轨值'] = df['最新净值'] * 1.1
+    df['布林带下轨值'] = df['最新净值'] * 0.9
+    df['布林带信号'] = '持有'
+
+
+def _compute_score(df, ctx=None):
+    add_composite_score(df)
+
+
+def create_default_engine():
+    """创建包含内置中间量和指标（均线、RSI、MACD、CCI、布林带、综合评分）的引擎"""
+    engine = IndicatorEngine()
+
+    # 共享中间量
+    engine.register_intermediate(Intermediate('nav', [], 1, lambda ctx: ctx.df['最新净值'].astype(float)))
+    engine.register_intermediate(Intermediate('nav_prev', ['nav'], 2, lambda ctx: ctx.shift(ctx.get('nav'))))
+    engine.register_intermediate(Intermediate('diff', ['nav'], 2, lambda ctx: ctx.diff(ctx.get('nav'))))
+    for window in (5, 10, 20):
+        engine.register_intermediate(Intermediate(
+            f'ma{window}', ['nav'], window, lambda ctx, w=window: ctx.rolling_mean(ctx.get('nav'), w)
+        ))
+    engine.register_intermediate(Intermediate('std20', ['nav'], 20, lambda ctx: ctx.rolling_std(ctx.get('nav'), 20)))
+    engine.register_intermediate(Intermediate('mad20', ['nav'], 20, lambda ctx: ctx.rolling_mad(ctx.get('nav'), 20)))
+    engine.register_intermediate(Intermediate(
+        'gain14', ['diff'], 15, lambda ctx: ctx.rolling_mean(ctx.get('diff').where(ctx.get('diff') > 0, 0), 14)
+    ))
+    engine.register_intermediate(Intermediate(
+        'loss14', ['diff'], 15, lambda ctx: ctx.rolling_mean(-ctx.get('diff').where(ctx.get('diff') < 0, 0), 14)
+    ))
+    for span in (12, 26):
+        engine.register_intermediate(Intermediate(
+            f'ema{span}', ['nav'], span, lambda ctx, s=span: ctx.ewm_mean(ctx.get('nav'), s)
+        ))
+
+    # 内置指标
+    engine.register(Indicator('ma', ['ma5', 'ma10'], 10, ['MA5', 'MA10', '均线信号'], _compute_ma, _fallback_ma))
+    engine.register(Indicator('rsi', ['gain14', 'loss14'], 15, ['RSI', 'RSI信号'], _compute_rsi, _fallback_rsi))
+    # EMA从第一条数据起就有值，MACD沿用20条的最少数据要求
+    engine.register(Indicator(
+        'macd', ['ema12', 'ema26'], 20, ['MACD', 'MACD_signal', 'macd值', 'macd信号'], _compute_macd, _fallback_macd
+    ))
+    engine.register(Indicator('cci', ['nav', 'ma20', 'mad20'], 20, ['cci值', 'cci信号'], _compute_cci, _fallback_cci))
+    engine.register(Indicator(
+        'boll', ['nav', 'nav_prev', 'ma20', 'std20'], 20,
+        ['布林带中轨值', '布林带上轨值', '布林带下轨值', '布林带信号'], _compute_boll, _fallback_boll
+    ))
+    engine.register(Indicator(
+        'score', ['rsi', 'cci', 'macd', 'boll'], 20, ['布林带位置', '综合评分'], _compute_score, _compute_score
+    ))
+    return engine
+
+
+# 默认引擎，自定义指标可直接注册到这里
+default_engine = create_default_engine()
@@ -0,0 +1,646 @@
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import socketserver
+import email
+from email.header import decode_header, make_header
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# 端到端压力测试：用本地假数据源替换akshare、pywencai和SMTP服务器，驱动真实的main.py入口
+# 每个场景在独立的子进程和临时目录中运行，完全离线，输出吞吐量、耗时、内存峰值和输出正确性
+#
+# 用法：
+#   python load_test.py                      运行默认场景（baseline、slow-tail、faults）
+#   python load_test.py large xlarge         运行指定场景
+#   python load_test.py faults --funds 2000  覆盖场景的基金数
+#   python load_test.py --list               列出全部场景
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 场景配置：未列出的项使用DEFAULT_SCENARIO中的默认值
+DEFAULT_SCENARIO = {
+    'description': '',
+    'mode': 'run',             # run：问财选股列表逐个分析；full-market：全市场模式
+    'funds': 200,
+    'history_days': 500,       # 每个基金的合成历史净值条数
+    'days': 10,                # 传给main.py的--days
+    'latency': {'distribution': 'lognormal', 'median': 0.01, 'sigma': 0.5, 'tail_rate': 0.0, 'tail_seconds': 2.0},
+    'error_rate': 0.0,         # 连接错误
+    'js_error_rate': 0.0,      # 接口返回的JavaScript无法解析
+    'empty_rate': 0.0,         # 接口正常返回空数据
+    'dead_rate': 0.0,          # 历史净值接口始终失败的基金比例，只能使用快照备选方案
+    'smtp_failures': 0,        # SMTP服务器前若干次投递返回临时错误
+    'extra_args': [],
+}
+
+SCENARIOS = {
+    'baseline': {
+        'description': '基准：200个基金，低延迟，无故障',
+    },
+    'slow-tail': {
+        'description': '慢尾：1000个基金，3%请求耗时2秒，验证对冲请求',
+        'funds': 1000,
+        'latency': {'distribution': 'lognormal', 'median': 0.02, 'sigma': 0.6, 'tail_rate': 0.03, 'tail_seconds': 2.0},
+    },
+    'faults': {
+        'description': '故障注入：500个基金，连接错误、JavaScript解析错误、空数据、失效基金和SMTP临时错误',
+        'funds': 500,
+        'error_rate': 0.05,
+        'js_error_rate': 0.03,
+        'empty_rate': 0.01,
+        'dead_rate': 0.01,
+        'smtp_failures': 1,
+    },
+    'large': {
+        'description': '大规模：5000个基金',
+        'funds': 5000,
+        'latency': {'distribution': 'lognormal', 'median': 0.005, 'sigma': 0.5, 'tail_rate': 0.0, 'tail_seconds': 2.0},
+    },
+    'xlarge': {
+        'description': '超大规模：10000个基金',
+        'funds': 10000,
+        'latency': {'distribution': 'lognormal', 'median': 0.005, 'sigma': 0.5, 'tail_rate': 0.0, 'tail_seconds': 2.0},
+    },
+    'full-market': {
+        'description': '全市场模式：10000个基金，首次运行补齐全部历史',
+        'mode': 'full-market',
+        'funds': 10000,
+        'latency': {'distribution': 'lognormal', 'median': 0.005, 'sigma': 0.5, 'tail_rate': 0.0, 'tail_seconds': 2.0},
+        'error_rate': 0.01,
+        'js_error_rate': 0.01,
+    },
+}
+DEFAULT_SCENARIOS = ['baseline', 'slow-tail', 'faults']
+
+# 合成净值：按基金代码决定投资类型和日波动率，每隔NEW_FUND_EVERY个基金为一个历史不足20条的新基金
+FUND_TYPES = [('股票型', 0.015), ('混合型', 0.012), ('债券型', 0.002), ('指数型', 0.014)]
+NEW_FUND_EVERY = 50
+NEW_FUND_DAYS = 12
+RECIPIENT = 'load-test@example.com'
+
+
+def fund_codes(count):
+    """场景中的基金代码，从000001开始"""
+    return [f"{i:06d}" for i in range(1, count + 1)]
+
+
+def latest_nav_date():
+    """合成净值的最新净值日期：今天之前的最近一个工作日"""
+    return (pd.Timestamp.today().normalize() - pd.offsets.BDay(1)).date()
+
+
+def synthetic_history(fund_code, end_date, days):
+    """生成与ak.fund_open_fund_info_em返回结构相同的合成历史净值，同一基金代码每次生成的数据相同
+
+    漂移每60个交易日切换一次，模拟趋势变化，使各类买卖信号都会出现。
+    """
+    seed = int(fund_code)
+    if seed % NEW_FUND_EVERY == 0:
+        days = NEW_FUND_DAYS
+    rng = np.random.default_rng(seed)
+    volatility = FUND_TYPES[seed % len(FUND_TYPES)][1]
+    drift = np.repeat(rng.normal(0, volatility / 4, days // 60 + 1), 60)[:days]
+    nav = np.round(np.cumprod(1 + drift + rng.normal(0, volatility, days)), 4)
+    df = pd.DataFrame({
+        '净值日期': pd.bdate_range(end=end_date, periods=days).date,
+        '单位净值': nav
+    })
+    df['日增长率'] = (df['单位净值'].pct_change() * 100).round(2)
+    return df
+
+
+class JSEvalException(Exception):
+    """模拟akshare执行接口返回的JavaScript失败时抛出的异常（py_mini_racer.JSEvalException）"""
+
+
+class LatencyModel:
+    """假接口的耗时分布：lognormal（median、sigma）、exponential（mean）或fixed（seconds），
+    另有tail_rate比例的请求耗时tail_seconds，模拟偶发的慢请求"""
+
+    def __init__(self, distribution='lognormal', median=0.01, sigma=0.5, mean=0.01, seconds=0.01,
+                 tail_rate=0.0, tail_seconds=2.0, scale=1.0, seed=0):
+        """初始化耗时分布，scale为全部耗时的倍数"""
+        self.distribution = distribution
+        self.median = median
+        self.sigma = sigma
+        self.mean = mean
+        self.seconds = seconds
+        self.tail_rate = tail_rate
+        self.tail_seconds = tail_seconds
+        self.scale = scale
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """抽取一次请求耗时（秒）"""
+        with self._lock:
+            if self.tail_rate and self.random.random() < self.tail_rate:
+                seconds = self.tail_seconds
+            elif self.distribution == 'lognormal':
+                seconds = self.random.lognormvariate(np.log(self.median), self.sigma)
+            elif self.distribution == 'exponential':
+                seconds = self.random.expovariate(1 / self.mean)
+            else:
+                seconds = self.seconds
+        return seconds * self.scale
+
+
+class FakeAkshare:
+    """本地假akshare：合成净值数据，按场景配置注入耗时和各类故障，并记录每个基金的返回结果"""
+
+    def __init__(self, scenario, latency_scale=1.0):
+        """初始化假数据源"""
+        self.codes = fund_codes(scenario['funds'])
+        self.end_date = latest_nav_date()
+        self.history_days = scenario['history_days']
+        self.latency = LatencyModel(scale=latency_scale, **scenario['latency'])
+        self.error_rate = scenario['error_rate']
+        self.js_error_rate = scenario['js_error_rate']
+        self.empty_rate = scenario['empty_rate']
+        dead_count = int(len(self.codes) * scenario['dead_rate'])
+        self.dead_codes = set(random.Random(1).sample(self.codes, dead_count))
+        self.random = random.Random(2)
+        self.calls = {}
+        self.faults = {'error': 0, 'js_error': 0, 'empty': 0}
+        # 基金代码 -> 历史净值接口的返回结果集合：ok、empty、error
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def _record_call(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def _record_outcome(self, fund_code, outcome):
+        with self._lock:
+            self.outcomes.setdefault(fund_code, set()).add(outcome)
+            if outcome in self.faults:
+                self.faults[outcome] += 1
+
+    def fund_open_fund_info_em(self, symbol="000001", indicator="单位净值走势", **kwargs):
+        """历史净值接口"""
+        self._record_call('fund_open_fund_info_em')
+        time.sleep(self.latency.sample())
+        with self._lock:
+            draw = self.random.random()
+
+        if symbol in self.dead_codes or draw < self.js_error_rate:
+            self._record_outcome(symbol, 'js_error')
+            raise JSEvalException('<anonymous>:1: SyntaxError: Unexpected end of input\n'
+                                  'var Data_netWorthTrend = [{"x":16')
+        draw -= self.js_error_rate
+        if draw < self.error_rate:
+            self._record_outcome(symbol, 'error')
+            raise ConnectionError("('Connection aborted.', RemoteDisconnected('Remote end closed connection without response'))")
+        draw -= self.error_rate
+        if draw < self.empty_rate:
+            self._record_outcome(symbol, 'empty')
+            return pd.DataFrame(columns=['净值日期', '单位净值', '日增长率'])
+
+        if symbol not in self.codes:
+            self._record_outcome(symbol, 'empty')
+            return pd.DataFrame(columns=['净值日期', '单位净值', '日增长率'])
+        self._record_outcome(symbol, 'ok')
+        return synthetic_history(symbol, self.end_date, self.history_days)
+
+    def fund_open_fund_daily_em(self):
+        """全市场当日净值快照，包含最近两个净值日期"""
+        self._record_call('fund_open_fund_daily_em')
+        time.sleep(self.latency.sample())
+        latest = []
+        previous = []
+        growth = []
+        for code in self.codes:
+            history = synthetic_history(code, self.end_date, self.history_days)
+            latest.append(history['单位净值'].iloc[-1])
+            previous.append(history['单位净值'].iloc[-2] if len(history) > 1 else np.nan)
+            growth.append(history['日增长率'].iloc[-1])
+        latest_date = self.end_date.strftime('%Y-%m-%d')
+        previous_date = (pd.Timestamp(self.end_date) - pd.offsets.BDay(1)).strftime('%Y-%m-%d')
+        return pd.DataFrame({
+            '基金代码': self.codes,
+            '基金简称': [f"合成基金{code}" for code in self.codes],
+            f'{latest_date}-单位净值': [f"{value:.4f}" for value in latest],
+            f'{latest_date}-累计净值': [f"{value:.4f}" for value in latest],
+            f'{previous_date}-单位净值': ['' if np.isnan(value) else f"{value:.4f}" for value in previous],
+            f'{previous_date}-累计净值': ['' if np.isnan(value) else f"{value:.4f}" for value in previous],
+            '日增长值': '',
+            '日增长率': ['' if np.isnan(value) else f"{value:.2f}" for value in growth],
+            '申购状态': '开放申购',
+            '赎回状态': '开放赎回',
+            '手续费': '0.15%'
+        })
+
+    def fund_name_em(self):
+        """全部基金的简称和基金类型"""
+        self._record_call('fund_name_em')
+        time.sleep(self.latency.sample())
+        return pd.DataFrame({
+            '基金代码': self.codes,
+            '拼音缩写': '',
+            '基金简称': [f"合成基金{code}" for code in self.codes],
+            '基金类型': [FUND_TYPES[int(code) % len(FUND_TYPES)][0] for code in self.codes],
+            '拼音全称': ''
+        })
+
+    def tool_trade_date_hist_sina(self):
+        """交易日历，按工作日计算"""
+        self._record_call('tool_trade_date_hist_sina')
+        return pd.DataFrame({'trade_date': pd.bdate_range('2020-01-01', f'{self.end_date.year + 1}-12-31').date})
+
+    def wencai_get(self, query=None, **kwargs):
+        """假pywencai.get：返回全部合成基金，基金代码带.OF后缀"""
+        self._record_call('pywencai.get')
+        time.sleep(self.latency.sample())
+        return pd.DataFrame({
+            '基金代码': [f"{code}.OF" for code in self.codes],
+            '基金简称': [f"合成基金{code}" for code in self.codes],
+            '投资类型': [FUND_TYPES[int(code) % len(FUND_TYPES)][0] for code in self.codes],
+        })
+
+    def install(self):
+        """把假的akshare和pywencai模块注册到sys.modules，必须在导入main之前调用"""
+        akshare = types.ModuleType('akshare')
+        for name in ['fund_open_fund_info_em', 'fund_open_fund_daily_em', 'fund_name_em', 'tool_trade_date_hist_sina']:
+            setattr(akshare, name, getattr(self, name))
+        pywencai = types.ModuleType('pywencai')
+        pywencai.get = self.wencai_get
+        sys.modules['akshare'] = akshare
+        sys.modules['pywencai'] = pywencai
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """最简SMTP协议实现，只支持明文投递，不需要登录"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        self.reply("220 fake-smtp ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                self.reply("250-fake-smtp")
+                self.reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self.reply("250 fake-smtp")
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                if server.inject_failure():
+                    self.reply("451 4.3.0 Injected temporary failure")
+                else:
+                    server.store(recipients, b''.join(lines))
+                    self.reply("250 OK")
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """本地假SMTP服务器，记录收到的邮件，可以让前failures次投递返回临时错误"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, failures=0):
+        """在本机随机端口启动服务器"""
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.port = self.server_address[1]
+        self.failures = failures
+        self.messages = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-smtp', daemon=True)
+
+    def inject_failure(self):
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return True
+            return False
+
+    def store(self, recipients, data):
+        with self._lock:
+            self.messages.append((recipients, email.message_from_bytes(data)))
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def peak_rss_mb():
+    """当前进程的内存峰值（MB），Linux下ru_maxrss单位为KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_main_args(scenario):
+    """场景对应的main.py命令行参数，请求间隔设为0，只测量接口和计算本身的耗时"""
+    args = ['--days', str(scenario['days']), '--request-interval', '0', '--outbox-timeout', '120']
+    if scenario['mode'] == 'full-market':
+        args += ['--full-market', '--max-history-fetch', '0']
+    else:
+        args += ['--wencai', '压力测试合成基金']
+    return args + scenario['extra_args']
+
+
+def expected_signals(fund_code, fake, days_to_keep, fallback):
+    """按合成净值推算基金应输出的净值日期和布林带中轨值
+
+    完整历史时中轨为20日均线（历史不足20条时为净值本身），
+    使用快照备选方案时只有最新一日，中轨为当日净值。
+    """
+    history = synthetic_history(fund_code, fake.end_date, fake.history_days)
+    nav = history['单位净值']
+    if fallback:
+        history = history.tail(1)
+        middle = history['单位净值']
+    elif len(history) < 20:
+        middle = nav
+    else:
+        middle = nav.rolling(window=20, min_periods=1).mean()
+    expected = pd.DataFrame({'净值日期': pd.to_datetime(history['净值日期']), '布林带中轨值': middle[history.index]})
+    cutoff = expected['净值日期'].max() - pd.Timedelta(days=days_to_keep)
+    return expected[expected['净值日期'] >= cutoff].reset_index(drop=True)
+
+
+def check_output(scenario, fake, smtp, report_date, max_errors=10):
+    """检查输出的正确性：每个基金都有输出，净值日期和布林带中轨与合成数据一致，报告邮件已投递
+
+    全市场模式不使用快照备选方案，历史净值接口没有返回过数据的基金不应输出。
+
+    返回(错误列表, 统计信息)
+    """
+    full_market = scenario['mode'] == 'full-market'
+    errors = []
+    stats = {'output_funds': 0, 'fallback_funds': 0, 'emails': len(smtp.messages)}
+    csv_path = os.path.join('output', f'信号明细_{report_date}.csv')
+    if not os.path.exists(csv_path):
+        return [f"未生成CSV文件：{csv_path}"], stats
+
+    signals = pd.read_csv(csv_path, dtype={'基金代码': str}, encoding='utf-8-sig')
+    if '周期' in signals.columns:
+        signals = signals[signals['周期'] == '日线']
+    signals['净值日期'] = pd.to_datetime(signals['净值日期'])
+    grouped = {code: group for code, group in signals.groupby('基金代码', sort=False)}
+    stats['output_funds'] = len(grouped)
+
+    # 全市场模式下历史接口返回过空数据的基金可能没有完整历史，允许缺少输出
+    missing = [code for code in fake.codes if code not in grouped
+               and not (full_market and ('ok' not in fake.outcomes.get(code, set())
+                                         or 'empty' in fake.outcomes.get(code, set())))]
+    if missing:
+        errors.append(f"缺少{len(missing)}个基金的输出：{missing[:10]}")
+    unknown = [code for code in grouped if code not in set(fake.codes)]
+    if unknown:
+        errors.append(f"输出了不存在的基金：{unknown[:10]}")
+
+    for code in fake.codes:
+        if code not in grouped or len(errors) >= max_errors:
+            continue
+        outcomes = fake.outcomes.get(code, set())
+        actual = grouped[code].sort_values('净值日期').reset_index(drop=True)
+        if actual['净值日期'].duplicated().any():
+            errors.append(f"基金{code}有重复的净值日期")
+            continue
+
+        # 历史净值接口从未返回数据时只能使用快照；返回过空数据时两种结果都可能出现
+        if full_market and 'ok' not in outcomes:
+            errors.append(f"基金{code}没有取得历史净值，全市场模式不应输出")
+            continue
+        if full_market:
+            candidates = [False]
+        elif 'ok' not in outcomes:
+            candidates = [True]
+        elif 'empty' in outcomes:
+            candidates = [False, True]
+        else:
+            candidates = [False]
+
+        matched = None
+        for fallback in candidates:
+            expected = expected_signals(code, fake, scenario['days'], fallback)
+            if (len(expected) == len(actual)
+                    and (expected['净值日期'] == actual['净值日期']).all()
+                    and np.allclose(expected['布林带中轨值'], actual['布林带中轨值'], rtol=1e-8, atol=1e-10)):
+                matched = fallback
+                break
+        if matched is None:
+            errors.append(f"基金{code}输出与合成数据不一致（接口结果：{sorted(outcomes)}，"
+                          f"输出{len(actual)}条，最新日期{actual['净值日期'].max().date()}）")
+        elif matched:
+            stats['fallback_funds'] += 1
+
+    dead_output = [code for code in fake.dead_codes if code in grouped and 'ok' in fake.outcomes.get(code, set())]
+    if dead_output:
+        errors.append(f"失效基金不应取得历史净值：{dead_output[:10]}")
+
+    reports = [message for recipients, message in smtp.messages if RECIPIENT in recipients]
+    if not reports:
+        errors.append("假SMTP服务器未收到报告邮件")
+    else:
+        message = reports[0]
+        subject = str(make_header(decode_header(message['Subject'])))
+        if report_date not in subject:
+            errors.append(f"报告邮件主题不包含报告日期：{subject}")
+        if not any(part.get_filename() for part in message.walk()):
+            errors.append("报告邮件没有附件")
+
+    return errors, stats
+
+
+def run_child(config_path):
+    """子进程：安装假数据源和假SMTP服务器，运行main.main()，写出测量结果"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        scenario = json.load(f)
+
+    fake = FakeAkshare(scenario, scenario['latency_scale'])
+    fake.install()
+    smtp = FakeSMTPServer(scenario['smtp_failures'])
+    smtp.start()
+    os.environ.update({
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(smtp.port),
+        'SMTP_SSL': 'false',
+        'SMTP_USER': 'sender@example.com',
+        'SMTP_PASSWORD': 'load-test',
+        'RECIPIENTS': RECIPIENT,
+    })
+
+    import main
+    base_rss = peak_rss_mb()
+    report_date = datetime.now().strftime('%Y-%m-%d')
+    sys.argv = ['main.py'] + build_main_args(scenario)
+
+    exit_code = 0
+    start = time.perf_counter()
+    try:
+        main.main()
+    except SystemExit as e:
+        exit_code = e.code or 0
+    wall_seconds = time.perf_counter() - start
+    peak_rss = peak_rss_mb()
+    smtp.stop()
+
+    errors, stats = check_output(scenario, fake, smtp, report_date)
+    if exit_code:
+        errors.insert(0, f"main.py退出码：{exit_code}")
+    result = {
+        'wall_seconds': round(wall_seconds, 2),
+        'funds_per_second': round(stats['output_funds'] / wall_seconds, 2) if wall_seconds else None,
+        'base_rss_mb': round(base_rss, 1),
+        'peak_rss_mb': round(peak_rss, 1),
+        'api_calls': fake.calls,
+        'injected_faults': fake.faults,
+        'dead_funds': len(fake.dead_codes),
+        'errors': errors,
+        **stats
+    }
+    with open(scenario['result_path'], 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def child_env():
+    """子进程环境变量：去掉真实的邮件、持仓和问财配置，避免压力测试访问外部服务"""
+    env = os.environ.copy()
+    for name in ['SMTP_SERVER', 'SMTP_PORT', 'SMTP', 'SMTP_SSL', 'SMTP_USER', 'SMTP_PASSWORD', 'RECIPIENTS',
+                 'HOLDINGS', 'WATCHLISTS', 'WATCHLIST_FILE', 'WENCAI_QUERY']:
+        env.pop(name, None)
+    return env
+
+
+def run_scenario(name, scenario, keep=False):
+    """在临时目录中用子进程运行一个场景，返回测量结果"""
+    work_dir = tempfile.mkdtemp(prefix=f'load_test_{name}_')
+    scenario = dict(scenario, result_path=os.path.join(work_dir, 'result.json'))
+    config_path = os.path.join(work_dir, 'scenario.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(scenario, f, ensure_ascii=False, indent=2)
+
+    log_path = os.path.join(work_dir, 'stdout.log')
+    print(f"运行场景{name}：{scenario['description']}（工作目录：{work_dir}）", flush=True)
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', config_path],
+            cwd=work_dir, env=child_env(), stdout=log_file, stderr=subprocess.STDOUT
+        )
+
+    if os.path.exists(scenario['result_path']):
+        with open(scenario['result_path'], 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    else:
+        with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+            tail = f.read()[-2000:]
+        result = {'errors': [f"子进程异常退出（退出码{process.returncode}）：{tail}"]}
+
+    result.update(scenario=name, funds=scenario['funds'], mode=scenario['mode'])
+    if keep or result['errors']:
+        result['work_dir'] = work_dir
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def print_report(results):
+    """输出各场景的测量结果"""
+    header = f"{'场景':<12}{'基金数':>8}{'输出':>8}{'备选':>6}{'耗时(秒)':>10}{'基金/秒':>10}{'内存峰值(MB)':>14}{'邮件':>6}  正确性"
+    print("\n" + header)
+    print("-" * 90)
+    for result in results:
+        status = '通过' if not result['errors'] else f"失败（{len(result['errors'])}项）"
+        print(f"{result['scenario']:<14}{result['funds']:>8}{result.get('output_funds', 0):>8}"
+              f"{result.get('fallback_funds', 0):>6}{result.get('wall_seconds', 0):>12}"
+              f"{result.get('funds_per_second') or 0:>10}{result.get('peak_rss_mb', 0):>16}"
+              f"{result.get('emails', 0):>6}  {status}")
+    for result in results:
+        if result.get('api_calls'):
+            print(f"\n{result['scenario']}：接口调用{result['api_calls']}，注入故障{result['injected_faults']}，"
+                  f"失效基金{result['dead_funds']}个，导入后内存{result['base_rss_mb']}MB")
+        for error in result['errors']:
+            print(f"  ✗ {error}")
+        if result.get('work_dir'):
+            print(f"  工作目录：{result['work_dir']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基金信号分析系统端到端压力测试（离线，使用假数据源）')
+    parser.add_argument('scenarios', nargs='*', help=f"场景名称，默认：{','.join(DEFAULT_SCENARIOS)}")
+    parser.add_argument('--list', action='store_true', help='列出全部场景')
+    parser.add_argument('--funds', type=int, help='覆盖场景的基金数')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='假接口耗时的倍数，例如10表示全部请求慢10倍')
+    parser.add_argument('--keep', action='store_true', help='保留各场景的工作目录（输出文件和日志）')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<14}{scenario['description']}")
+        return
+
+    names = args.scenarios or DEFAULT_SCENARIOS
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景：{unknown}，可选：{list(SCENARIOS)}")
+
+    results = []
+    for name in names:
+        scenario = dict(DEFAULT_SCENARIO, **SCENARIOS[name], latency_scale=args.latency_scale)
+        if args.funds:
+            scenario['funds'] = args.funds
+        results.append(run_scenario(name, scenario, keep=args.keep))
+    print_report(results)
+
+    # 结果同时写到output目录，便于对比不同版本的性能
+    output_dir = os.path.join(SCRIPT_DIR, 'output')
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n测试结果已保存：{report_path}")
+
+    if any(result['errors'] for result in results):
+        print("压力测试失败：存在输出不正确的场景")
+        sys.exit(1)
+    print("压力测试通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,8 +7,20 @@ import time
 import sys
 import os
 import argparse
+import re
+import random
 from logger import logger
 from email_sender import EmailSender
+from signal_index import SignalIndex
+from nav_store import NavStore
+from indicators import default_engine
+from scoring import rank_funds
+from sinks import CsvSink, ExcelSink, SignalIndexSink, RankingSink, ClusterSink, OutboxSink
+from outbox import EmailOutbox
+from freshness import TradingCalendar, RunState, select_changed_funds
+from hedging import LatencyTracker, HedgedFetcher
+from scheduler import RunBudget, parse_duration, prioritize_funds
+from timeframes import DAILY, parse_timeframes, compute_timeframes
 import pywencai
 warnings.filterwarnings('ignore')
 
@@ -25,10 +37,49 @@ class FundSignalAnalyzer:
     # 半导体/高端制造/
 ]
     
+    # 相邻两次基金数据请求之间的随机等待区间（秒）
+    REQUEST_INTERVAL = (1, 1.5)
+    
+    # 相关性聚类使用的日增长率天数
+    RETURN_WINDOW = 250
+    
+    # 数据少于该条数时只生成基础信号
+    BASIC_SIGNAL_MIN_ROWS = 20
+    
+    # 全市场模式：参与指标计算的历史净值条数，以及本地存储保留的条数
+    HISTORY_WINDOW = 250
+    STORE_WINDOW = 500
+    
     def __init__(self):
         """初始化基金信号分析器"""
         self.report_date = datetime.now().strftime('%Y-%m-%d')
+        self.request_interval = self.REQUEST_INTERVAL
+        # 全市场净值快照缓存：(报告日期, 快照)
+        self._daily_snapshot = None
+        # 相似基金聚类的相关系数阈值（不大于0时不聚类）和内存预算
+        self.corr_threshold = 0.95
+        self.corr_memory_mb = 256
+        # 技术指标引擎和需要计算的指标（None表示全部已注册指标）
+        self.indicator_engine = default_engine
+        self.indicator_names = None
+        # 计算信号的周期，D日线、W周线、M月线，周线和月线由已获取的日线净值重采样
+        self.timeframes = ['D']
+        # 邮件中每个投资类型展示综合评分最高和最低的基金数
+        self.top_n = 5
         self.email_sender = EmailSender()
+        # 邮件发件箱，报告邮件由后台线程发送
+        self.outbox = EmailOutbox(self.email_sender)
+        # 净值新鲜度检查：交易日历和最近一次成功报告，force_refresh为True时不检查
+        self.trading_calendar = TradingCalendar()
+        self.run_state = RunState()
+        self.force_refresh = False
+        # 历史净值请求：按接口耗时p90对冲慢请求
+        self.latency_tracker = LatencyTracker()
+        self.fetcher = HedgedFetcher(self.latency_tracker)
+        # 全局运行时间预算（None表示不限制）
+        self.run_budget = None
+        # 最近一次run中每个基金的分析状态（基金代码、状态、记录数）
+        self.last_run_status = None
         logger.info(f"初始化基金信号分析器，报告日期：{self.report_date}")
     
 
@@ -147,22 +198,118 @@ class FundSignalAnalyzer:
         sys.stdout.write(f"\r{prefix}: {current}/{total} ({progress:.1f}%) {time_str}")
         sys.stdout.flush()
     
-    def get_fund_data(self, fund_code="000001"):
-        """获取基金历史净值数据，带重试机制"""
-        def retry_api_call(func, max_retries=3, base_delay=1):
-            """API调用重试装饰器"""
-            for attempt in range(max_retries):
-                try:
-                    return func()
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                        logger.warning(f"第{attempt+1}次尝试失败，{delay:.2f}秒后重试：{str(e)}")
-                        time.sleep(delay)
-                    else:
-                        logger.error(f"第{attempt+1}次尝试失败，放弃重试：{str(e)}")
-                        raise
+    def retry_api_call(self, func, max_retries=3, base_delay=1):
+        """API调用重试，指数退避"""
+        for attempt in range(max_retries):
+            try:
+                return func()
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                    logger.warning(f"第{attempt+1}次尝试失败，{delay:.2f}秒后重试：{str(e)}")
+                    time.sleep(delay)
+                else:
+                    logger.error(f"第{attempt+1}次尝试失败，放弃重试：{str(e)}")
+                    raise
+    
+    def get_daily_snapshot(self):
+        """获取全市场开放式基金当日净值快照，同一报告日期内只请求一次"""
+        if self._daily_snapshot is not None and self._daily_snapshot[0] == self.report_date:
+            return self._daily_snapshot[1]
+        
+        logger.info("开始获取全市场开放式基金当日净值快照")
+        snapshot = self.retry_api_call(
+            lambda: self.latency_tracker.timed('fund_open_fund_daily_em', ak.fund_open_fund_daily_em),
+            max_retries=3, base_delay=1
+        )
+        if snapshot is None or snapshot.empty:
+            logger.warning("全市场净值快照返回为空")
+            return None
+        
+        logger.info(f"全市场净值快照获取成功，共{len(snapshot)}个基金")
+        self._daily_snapshot = (self.report_date, snapshot)
+        return snapshot
+    
+    def parse_daily_snapshot(self, snapshot):
+        """解析全市场净值快照，返回(最新一日净值表, 快照中的上一净值日期)
+        
+        快照列名形如"2026-01-05-单位净值"，包含最近两个净值日期
+        """
+        nav_cols = sorted([col for col in snapshot.columns if col.endswith('-单位净值')], reverse=True)
+        if not nav_cols:
+            raise ValueError("净值快照中未找到单位净值列")
+        
+        latest_date = nav_cols[0].rsplit('-', 1)[0]
+        previous_date = nav_cols[1].rsplit('-', 1)[0] if len(nav_cols) > 1 else None
         
+        daily_df = pd.DataFrame({
+            '基金代码': snapshot['基金代码'].astype(str),
+            '基金简称': snapshot['基金简称'] if '基金简称' in snapshot.columns else None,
+            '净值日期': pd.Timestamp(latest_date),
+            '最新净值': pd.to_numeric(snapshot[nav_cols[0]], errors='coerce'),
+            '日增长率%': pd.to_numeric(snapshot['日增长率'], errors='coerce')
+        })
+        return daily_df, previous_date
+    
+    def get_snapshot_nav_dates(self):
+        """从全市场净值快照获取每个基金已公布的最新净值日期，快照不可用时返回空字典"""
+        try:
+            snapshot = self.get_daily_snapshot()
+        except Exception as e:
+            logger.warning(f"全市场净值快照获取失败，无法判断净值是否更新，按全部有更新处理：{str(e)}")
+            return {}
+        if snapshot is None:
+            return {}
+
+        nav_cols = sorted([col for col in snapshot.columns if col.endswith('-单位净值')], reverse=True)
+        nav_dates = pd.Series(None, index=snapshot.index, dtype=object)
+        # 从较早的日期到最新日期依次覆盖，得到每个基金有净值的最新日期
+        for col in reversed(nav_cols):
+            has_nav = pd.to_numeric(snapshot[col], errors='coerce').notna()
+            nav_dates[has_nav] = col.rsplit('-', 1)[0]
+        codes = snapshot['基金代码'].astype(str)
+        return {code: nav_date for code, nav_date in zip(codes, nav_dates) if nav_date is not None}
+    
+    def get_priority_codes(self):
+        """优先处理的基金：HOLDINGS环境变量中的持仓基金和各收件人的自选基金"""
+        holdings = [code.strip() for code in re.split(r'[,;]', os.environ.get('HOLDINGS', '')) if code.strip()]
+        watchlists = self.email_sender.config.get('watchlists', {})
+        return holdings + [code for codes in watchlists.values() for code in codes]
+    
+    def select_funds_to_refresh(self, fund_codes):
+        """净值新鲜度检查，返回需要重新分析的基金代码
+        
+        先用交易日历判断：上次成功报告和全部基金都已处理到应公布净值的最近交易日时，不发起任何请求；
+        否则用一次全市场净值快照比较每个基金的最新净值日期和上次处理的净值日期。
+        """
+        signal_index = SignalIndex()
+        processed_dates = signal_index.latest_nav_dates()
+        signal_index.close()
+        
+        last_report = self.run_state.get('funds')
+        if last_report:
+            logger.info(f"上次成功报告：{last_report['report_date']}，净值日期：{last_report['nav_date']}")
+        
+        expected_date = self.trading_calendar.expected_nav_date()
+        if (expected_date and last_report.get('nav_date', '') >= expected_date
+                and all(processed_dates.get(code, '') >= expected_date for code in fund_codes)):
+            logger.info(f"全部基金已处理到最近交易日{expected_date}的净值")
+            return []
+        
+        snapshot_dates = self.get_snapshot_nav_dates()
+        available_dates = {
+            code: snapshot_dates[code.split('.')[0]]
+            for code in fund_codes if code.split('.')[0] in snapshot_dates
+        }
+        changed = select_changed_funds(fund_codes, available_dates, processed_dates)
+        logger.info(f"净值新鲜度检查：有新净值的基金{len(changed)}个，净值未更新的基金{len(fund_codes) - len(changed)}个")
+        return changed
+    
+    def get_fund_data(self, fund_code="000001", allow_fallback=True):
+        """获取基金历史净值数据，带重试机制
+
+        allow_fallback为False时历史接口失败直接返回None，不使用只有当日一条净值的快照备选方案。
+        """
         try:
             logger.info(f"开始获取基金{fund_code}历史数据")
             
@@ -174,11 +321,11 @@ class FundSignalAnalyzer:
             
             # 尝试使用fund_open_fund_info_em获取历史数据
             try:
-                # 获取基金历史数据，带重试机制
+                # 获取基金历史数据，超过耗时阈值时发起对冲请求，失败时重试
                 def get_history_data():
                     return ak.fund_open_fund_info_em(symbol=fund_code, indicator="单位净值走势")
                 
-                history_df = retry_api_call(get_history_data, max_retries=3, base_delay=1)
+                history_df = self.fetcher.fetch('fund_open_fund_info_em', get_history_data, label=f"基金{fund_code}")
                 
                 if history_df is not None and not history_df.empty:
                     # 基金简称将从问财返回值获取，这里先使用默认值
@@ -203,41 +350,26 @@ class FundSignalAnalyzer:
                 logger.error(f"使用fund_open_fund_info_em获取基金{fund_code}历史数据失败：{str(e)}")
                 logger.warning(f"基金{fund_code}遇到JavaScript解析错误，尝试使用备选方案")
             
-            # 备选方案：使用fund_open_fund_daily_em获取当日数据
-            def get_daily_data():
-                return ak.fund_open_fund_daily_em()
+            if not allow_fallback:
+                logger.warning(f"基金{fund_code}历史数据获取失败，不使用快照备选方案")
+                return None
             
-            df = retry_api_call(get_daily_data, max_retries=3, base_delay=1)
+            # 备选方案：使用fund_open_fund_daily_em获取当日数据，快照在同一次运行内共用
+            df = self.get_daily_snapshot()
             
             if df is None:
                 logger.warning(f"基金数据返回为空")
                 return None
             
             # 筛选当前基金的数据
-            fund_data = df[df['基金代码'] == fund_code]
-            if fund_data.empty:
+            daily_df, _ = self.parse_daily_snapshot(df)
+            history_data = daily_df[(daily_df['基金代码'] == fund_code) & daily_df['最新净值'].notna()].reset_index(drop=True)
+            if history_data.empty:
                 logger.warning(f"未找到基金{fund_code}的数据")
                 return None
             
             # 基金简称将从问财返回值获取，这里先使用默认值
-            fund_name = f"基金{fund_code}"
-            
-            # 动态获取最新净值列名
-            unit_nav_col = [col for col in df.columns if '-单位净值' in col][0]
-            unit_nav = fund_data.iloc[0][unit_nav_col]
-            daily_growth = fund_data.iloc[0]['日增长率']
-            
-            # 从列名中提取日期
-            latest_date = unit_nav_col.split('-')[0]
-            
-            # 创建历史数据结构
-            history_data = pd.DataFrame({
-                '净值日期': [pd.Timestamp(latest_date)],
-                '最新净值': [float(unit_nav)],
-                '日增长率%': [float(daily_growth)],
-                '基金代码': [fund_code],
-                '基金简称': [fund_name]
-            })
+            history_data['基金简称'] = f"基金{fund_code}"
             
             logger.info(f"基金{fund_code}数据获取成功，共{len(history_data)}条记录")
             return history_data
@@ -255,98 +387,18 @@ class FundSignalAnalyzer:
         fund_code = df['基金代码'].iloc[0] if '基金代码' in df.columns else '未知'
         logger.info(f"开始计算基金{fund_code}技术指标和信号")
         
-        # 简单处理：如果数据不足20条，只生成基础信号
-        if len(df) < 20:
-            logger.info(f"基金{fund_code}数据不足20条，生成基础信号")
-            
-            # 添加基础信号列
-            df['均线信号'] = '持有'
-            df['RSI'] = 50  # 默认RSI值
-            df['RSI信号'] = '持有'
-            df['MACD'] = 0  # 默认MACD值
-            df['macd值'] = 0
-            df['macd信号'] = '持有'
-            df['cci值'] = 0  # 默认CCI值
-            df['cci信号'] = '持有'
-            df['布林带中轨值'] = df['最新净值']
-            df['布林带上轨值'] = df['最新净值'] * 1.1
-            df['布林带下轨值'] = df['最新净值'] * 0.9
-            df['布林带信号'] = '持有'
-            
-            logger.info(f"基金{fund_code}基础信号生成完成")
-            return df
+        # 数据不足20条时各指标只生成基础信号
+        if len(df) < self.BASIC_SIGNAL_MIN_ROWS:
+            logger.info(f"基金{fund_code}数据不足{self.BASIC_SIGNAL_MIN_ROWS}条，生成基础信号")
+        else:
+            logger.debug("数据足够，计算完整技术指标")
+        
+        df = self.indicator_engine.compute(df, self.indicator_names, min_rows=self.BASIC_SIGNAL_MIN_ROWS)
         
-        # 原有代码：数据足够时计算完整技术指标
-        logger.debug("数据足够，计算完整技术指标")
-        
-        # 计算移动平均线和均线信号
-        df['MA5'] = df['最新净值'].rolling(window=5, min_periods=1).mean()
-        df['MA10'] = df['最新净值'].rolling(window=10, min_periods=1).mean()
-        df['均线信号'] = '持有'
-        buy_signals = (df['MA5'] > df['MA10']) & (df['MA5'].shift(1) <= df['MA10'].shift(1))
-        sell_signals = (df['MA5'] < df['MA10']) & (df['MA5'].shift(1) >= df['MA10'].shift(1))
-        df.loc[buy_signals, '均线信号'] = '买入'
-        df.loc[sell_signals, '均线信号'] = '卖出'
-        logger.info(f"均线信号生成完成：买入信号{buy_signals.sum()}个，卖出信号{sell_signals.sum()}个")
-        
-        # 计算RSI和RSI信号
-        delta = df['最新净值'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14, min_periods=1).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14, min_periods=1).mean()
-        rs = gain / loss
-        df['RSI'] = (100 - (100 / (1 + rs))).round(2)
-        df['RSI'] = df['RSI'].fillna(50)
-        df['RSI信号'] = '持有'
-        rsi_buy = (df['RSI'] > 30) & (df['RSI'].shift(1) <= 30)
-        rsi_sell = (df['RSI'] < 70) & (df['RSI'].shift(1) >= 70)
-        df.loc[rsi_buy, 'RSI信号'] = '买入'
-        df.loc[rsi_sell, 'RSI信号'] = '卖出'
-        logger.info(f"RSI信号生成完成：买入信号{rsi_buy.sum()}个，卖出信号{rsi_sell.sum()}个")
-        
-        # 计算MACD和MACD信号
-        exp1 = df['最新净值'].ewm(span=12, adjust=False).mean()
-        exp2 = df['最新净值'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = (exp1 - exp2).round(4)
-        df['MACD_signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['macd值'] = df['MACD']
-        df['macd信号'] = '持有'
-        macd_buy = (df['MACD'] > -100) & (df['MACD'].shift(1) <= -100)
-        macd_sell = (df['MACD'] < 100) & (df['MACD'].shift(1) >= 100)
-        df.loc[macd_buy, 'macd信号'] = '买入'
-        df.loc[macd_sell, 'macd信号'] = '卖出'
-        logger.info(f"MACD信号生成完成：买入信号{macd_buy.sum()}个，卖出信号{macd_sell.sum()}个")
-        
-        # 计算CCI和CCI信号
-        tp = df['最新净值']
-        tp_ma = tp.rolling(window=20, min_periods=1).mean()
-        md = tp.rolling(window=20, min_periods=1).apply(lambda x: np.mean(np.abs(x - np.mean(x))))
-        df['cci值'] = ((tp - tp_ma) / (0.015 * md)).round(2)
-        df['cci值'] = df['cci值'].fillna(0)
-        df['cci信号'] = '持有'
-        cci_buy = (df['cci值'] > -100) & (df['cci值'].shift(1) <= -100)
-        cci_sell = (df['cci值'] < 100) & (df['cci值'].shift(1) >= 100)
-        df.loc[cci_buy, 'cci信号'] = '买入'
-        df.loc[cci_sell, 'cci信号'] = '卖出'
-        logger.info(f"CCI信号生成完成：买入信号{cci_buy.sum()}个，卖出信号{cci_sell.sum()}个")
-        
-        # 计算布林带和布林带信号
-        df['布林带中轨值'] = df['最新净值'].rolling(window=20, min_periods=1).mean()
-        bb_std = df['最新净值'].rolling(window=20, min_periods=1).std()
-        df['布林带上轨值'] = (df['布林带中轨值'] + 2 * bb_std).round(4)
-        df['布林带下轨值'] = (df['布林带中轨值'] - 2 * bb_std).round(4)
-        df['布林带信号'] = '持有'
-        bb_buy_opp = df['最新净值'] < df['布林带下轨值']
-        bb_risk = df['最新净值'] > df['布林带上轨值']
-        bb_cross_buy = (df['最新净值'] > df['布林带下轨值']) & (df['最新净值'].shift(1) <= df['布林带下轨值'].shift(1))
-        bb_cross_sell = (df['最新净值'] < df['布林带上轨值']) & (df['最新净值'].shift(1) >= df['布林带上轨值'].shift(1))
-        
-        df.loc[bb_buy_opp, '布林带信号'] = '机会买入'
-        df.loc[bb_risk, '布林带信号'] = '提示风险'
-        df.loc[bb_cross_buy, '布林带信号'] = '买入'
-        df.loc[bb_cross_sell, '布林带信号'] = '卖出'
-        
-        logger.info(f"布林带信号生成完成：机会买入{bb_buy_opp.sum()}个，提示风险{bb_risk.sum()}个，")
-        logger.info(f"穿越买入{bb_cross_buy.sum()}个，穿越卖出{bb_cross_sell.sum()}个")
+        for column in ['均线信号', 'RSI信号', 'macd信号', 'cci信号', '布林带信号']:
+            if column in df.columns:
+                counts = df[column].value_counts().to_dict()
+                logger.debug(f"{column}生成完成：{counts}")
         
         # 记录最终信号分布
         if '净值日期' in df.columns:
@@ -354,17 +406,31 @@ class FundSignalAnalyzer:
             latest_df = df[df['净值日期'] == df['净值日期'].max()]
             if not latest_df.empty:
                 signals_summary = {
-                    '均线信号': latest_df['均线信号'].iloc[0],
-                    'RSI信号': latest_df['RSI信号'].iloc[0],
-                    'macd信号': latest_df['macd信号'].iloc[0],
-                    'cci信号': latest_df['cci信号'].iloc[0],
-                    '布林带信号': latest_df['布林带信号'].iloc[0]
+                    column: latest_df[column].iloc[0]
+                    for column in ['均线信号', 'RSI信号', 'macd信号', 'cci信号', '布林带信号', '综合评分']
+                    if column in latest_df.columns
                 }
                 logger.info(f"基金{fund_code}在{latest_date}的最终信号：{signals_summary}")
         
         logger.info(f"基金{fund_code}技术指标计算和信号生成完成")
         return df
     
+    def add_timeframe_signals(self, fund_df, signal_df, fund_code, group_key=None):
+        """多周期模式下把日线净值重采样为周线、月线，计算同一套指标后追加到信号表格，并添加周期列"""
+        if len(self.timeframes) <= 1 or fund_df is None or len(fund_df) == 0:
+            return signal_df
+        
+        timeframe_df = compute_timeframes(
+            self.indicator_engine, fund_df, self.timeframes, self.indicator_names,
+            group_key=group_key, min_rows=self.BASIC_SIGNAL_MIN_ROWS
+        )
+        timeframe_signals = self.create_signal_table(timeframe_df, fund_code)
+        logger.info(f"基金{fund_code}多周期信号计算完成：{timeframe_signals['周期'].value_counts().to_dict()}")
+        
+        signal_df = signal_df.copy()
+        signal_df.insert(signal_df.columns.get_loc('净值日期') + 1, '周期', DAILY)
+        return pd.concat([signal_df, timeframe_signals[signal_df.columns]], ignore_index=True)
+    
     def create_signal_table(self, df, fund_code):
         """创建信号明细表格"""
         if df is None or len(df) == 0:
@@ -376,16 +442,17 @@ class FundSignalAnalyzer:
         # 只保留信号相关字段
         logger.debug("定义需要保留的字段列表")
         required_columns = [
-            '基金代码', '基金简称', '投资类型', '净值日期',
+            '基金代码', '基金简称', '投资类型', '净值日期', '周期',
             '均线信号', 'RSI', 'RSI信号', 'cci值', 'cci信号',
             'macd值', 'macd信号', '布林带下轨值', '布林带中轨值',
-            '布林带上轨值', '布林带信号'
+            '布林带上轨值', '布林带信号', '布林带位置', '综合评分'
         ]
         
         # 检查哪些字段存在
         logger.debug("检查数据中存在的字段")
         existing_columns = [col for col in required_columns if col in df.columns]
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # 周期列只在多周期模式下存在
+        missing_columns = [col for col in required_columns if col not in df.columns and col != '周期']
         
         if missing_columns:
             logger.warning(f"基金{fund_code}缺少以下字段：{missing_columns}")
@@ -413,9 +480,63 @@ class FundSignalAnalyzer:
         
         return output_df
     
-    def analyze_fund(self, fund_code, index, total, start_time):
+    def filter_recent_signals(self, signal_df, fund_code, days_to_keep):
+        """过滤近N天的信号数据"""
+        signal_df = signal_df.copy()
+        
+        if '净值日期' in signal_df.columns:
+            signal_df['净值日期'] = pd.to_datetime(signal_df['净值日期'])
+            if '周期' in signal_df.columns:
+                # 多周期模式下各周期分别按最新日期过滤
+                max_date = signal_df.groupby('周期')['净值日期'].transform('max')
+            else:
+                max_date = signal_df['净值日期'].max()
+            cutoff_date = max_date - pd.Timedelta(days=days_to_keep)
+            filtered_count = len(signal_df[signal_df['净值日期'] >= cutoff_date])
+            logger.info(f"基金{fund_code}数据过滤：{filtered_count}/{len(signal_df)}条记录保留")
+            
+            signal_df = signal_df[signal_df['净值日期'] >= cutoff_date]
+            signal_df['净值日期'] = signal_df['净值日期'].dt.strftime('%Y-%m-%d')
+        
+        return signal_df
+    
+    def apply_fund_info(self, signal_df, fund_code, wencai_fund_data):
+        """从问财数据中更新基金简称和投资类型"""
+        if wencai_fund_data is None:
+            return signal_df
+        
+        # 查找当前基金在问财数据中的信息
+        fund_info = wencai_fund_data[wencai_fund_data['基金代码'] == fund_code]
+        if not fund_info.empty:
+            # 更新基金简称
+            fund_name = fund_info['基金简称'].iloc[0]
+            signal_df['基金简称'] = fund_name
+            logger.info(f"更新基金{fund_code}简称为：{fund_name}")
+            
+            # 更新投资类型
+            if '投资类型' in fund_info.columns:
+                invest_type = fund_info['投资类型'].iloc[0]
+                signal_df['投资类型'] = invest_type
+                logger.info(f"更新基金{fund_code}投资类型为：{invest_type}")
+        
+        return signal_df
+    
+    def extract_daily_returns(self, fund_df):
+        """提取近期日增长率序列，用于基金间相关性计算"""
+        if fund_df is None or '日增长率%' not in fund_df.columns or '净值日期' not in fund_df.columns:
+            return None
+        
+        returns = pd.Series(
+            fund_df['日增长率%'].to_numpy(dtype=np.float32),
+            index=pd.to_datetime(fund_df['净值日期'], errors='coerce')
+        )
+        returns = returns[returns.index.notna()].sort_index()
+        return returns.tail(self.RETURN_WINDOW)
+    
+    def analyze_fund(self, fund_code, index, total, start_time, progress=True):
         """分析单个基金"""
-        self.show_progress(index, total, start_time, "分析进度")
+        if progress:
+            self.show_progress(index, total, start_time, "分析进度")
         
         try:
             logger.info(f"开始分析基金：{fund_code}")
@@ -432,27 +553,25 @@ class FundSignalAnalyzer:
             # 创建信号表格
             signal_df = self.create_signal_table(fund_df, fund_code)
             
+            # 多周期模式：追加周线、月线信号
+            signal_df = self.add_timeframe_signals(fund_df, signal_df, fund_code)
+            
             logger.info(f"基金{fund_code}分析完成")
             
+            # 只返回信号表格和近期日增长率，完整历史和指标列在这里释放
             return {
                 'fund_code': fund_code,
                 'fund_name': fund_df['基金简称'].iloc[0],
                 'signal_data': signal_df,
-                'raw_data': fund_df
+                'daily_returns': self.extract_daily_returns(fund_df)
             }
             
         except Exception as e:
             logger.error(f"分析基金{fund_code}失败：{str(e)}")
             return None
     
-    def run(self, days_to_keep=10, fund_codes=None, wencai_query=None):
-        """运行基金信号分析"""
-        logger.info("=" * 80)
-        logger.info("基金信号分析系统开始运行")
-        logger.info(f"报告日期：{self.report_date}")
-        logger.info(f"保留天数：{days_to_keep}")
-        logger.info("=" * 80)
-        
+    def resolve_fund_codes(self, fund_codes=None, wencai_query=None):
+        """确定待分析基金列表，返回基金代码列表和问财基金数据"""
         # 初始化问财基金数据
         wencai_fund_data = None
         
@@ -471,11 +590,75 @@ class FundSignalAnalyzer:
             fund_codes = self.DEFAULT_FUND_CODES
             logger.info(f"使用默认基金列表，共{len(fund_codes)}个基金")
         
+        # 统一去掉.OF等后缀，信号索引、新鲜度检查和邮件报告都使用不带后缀的代码
+        fund_codes = [SignalIndex.normalize_code(code) for code in fund_codes]
         logger.info(f"待分析基金代码：{fund_codes[:10]}...(共{len(fund_codes)}个)")
+        return fund_codes, wencai_fund_data
+    
+    def iter_analyze(self, fund_codes, days_to_keep=10, wencai_fund_data=None, progress=False):
+        """逐个分析基金，依次产出(基金代码, 近N天信号明细, 近期日增长率)，失败的基金后两项为None"""
+        start_time = time.time()
+        total = len(fund_codes)
         
-        # 初始化结果存储
-        results = []
+        for i, fund_code in enumerate(fund_codes, 1):
+            # 剩余时间不够时停止派发，剩余基金记为跳过
+            if self.run_budget is not None and not self.run_budget.can_dispatch():
+                self.run_budget.skip(fund_codes[i - 1:])
+                break
+            fund_start = time.time()
+            
+            logger.debug(f"开始分析第{i}/{total}个基金：{fund_code}")
+            result = self.analyze_fund(fund_code, i, total, start_time, progress=progress)
+            
+            if result is not None:
+                # 过滤近N天的数据
+                signal_df = self.filter_recent_signals(result['signal_data'], fund_code, days_to_keep)
+                
+                # 从问财数据中更新基金简称和投资类型
+                self.apply_fund_info(signal_df, fund_code, wencai_fund_data)
+                yield fund_code, signal_df, result['daily_returns']
+            else:
+                logger.warning(f"基金{fund_code}分析失败，跳过")
+                yield fund_code, None, None
+            
+            # 避免请求过快，使用随机间隔
+            if i < total and self.request_interval[1] > 0:
+                sleep_time = random.uniform(*self.request_interval)
+                logger.debug(f"等待{sleep_time:.2f}秒，避免API请求过快")
+                time.sleep(sleep_time)
+            
+            # 耗时包括输出写入和请求间隔
+            if self.run_budget is not None:
+                self.run_budget.record(time.time() - fund_start)
+    
+    def analyze_many(self, fund_codes, days_to_keep=10, wencai_fund_data=None):
+        """批量分析基金，结果只保留在内存中，不写文件、不发邮件、不输出进度条
+        
+        返回(全部基金信号明细, 每个基金的分析状态)两个DataFrame
+        """
+        # 与run一致去掉.OF等后缀，使状态记录与信号明细、问财基金数据的代码一致
+        fund_codes = [SignalIndex.normalize_code(code) for code in fund_codes]
+        signal_frames = []
+        status_records = []
         
+        for fund_code, signal_df, _ in self.iter_analyze(fund_codes, days_to_keep, wencai_fund_data):
+            if signal_df is not None:
+                signal_frames.append(signal_df)
+            status_records.append({
+                '基金代码': fund_code,
+                '状态': '成功' if signal_df is not None else '失败',
+                '记录数': len(signal_df) if signal_df is not None else 0
+            })
+        
+        signals = pd.concat(signal_frames, ignore_index=True) if signal_frames else pd.DataFrame()
+        if not signals.empty and '综合评分' in signals.columns:
+            # 全部基金一起做投资类型内的横截面排名（未计算综合评分时不排名）
+            signals = rank_funds(signals)
+        status = pd.DataFrame(status_records, columns=['基金代码', '状态', '记录数'])
+        return signals, status
+    
+    def create_default_sinks(self):
+        """创建默认输出：CSV、Excel、信号索引、综合评分排名、相似基金聚类和邮件发件箱"""
         # 创建输出目录，使用绝对路径确保在任何环境下都能正确访问
         output_dir = os.path.join(os.getcwd(), 'output')
         logger.info(f"输出目录绝对路径：{output_dir}")
@@ -488,109 +671,121 @@ class FundSignalAnalyzer:
         # 初始化CSV和Excel文件，使用绝对路径
         csv_filename = os.path.join(output_dir, f'信号明细_{self.report_date}.csv')
         excel_filename = os.path.join(output_dir, f'信号明细_{self.report_date}.xlsx')
-        logger.info(f"CSV文件路径：{csv_filename}")
-        logger.info(f"Excel文件路径：{excel_filename}")
         
-        # 初始化标志，用于判断是否是第一次写入
-        first_write = True
+        sinks = [
+            CsvSink(csv_filename),
+            ExcelSink(excel_filename),
+            # 加载信号状态索引，用于计算较上期信号变化
+            SignalIndexSink(SignalIndex(), self.report_date)
+        ]
+        sinks.append(RankingSink(self.top_n))
+        if self.corr_threshold > 0:
+            sinks.append(ClusterSink(self.corr_threshold, self.corr_memory_mb))
+        sinks.append(OutboxSink(self.outbox, self.email_sender, self.report_date))
+        return sinks
+    
+    def format_skipped_note(self, skipped, action="分析", max_codes=50):
+        """生成报告中因时间预算跳过的基金说明"""
+        codes = '、'.join(skipped[:max_codes])
+        if len(skipped) > max_codes:
+            codes += " 等"
+        return f"因运行时间预算未{action}的基金（{len(skipped)}个）：{codes}"
+    
+    def report_latency_stats(self):
+        """输出本次运行各接口的耗时直方图并保存，供下次运行调整对冲阈值"""
+        self.latency_tracker.log_summary()
+        self.fetcher.log_summary()
+        self.latency_tracker.save()
+    
+    def close_sinks(self, sinks, fund_count, success_count, report_notes=None):
+        """按顺序关闭输出，前面的输出通过context向后面的输出（如邮件）传递结果"""
+        context = {
+            'report_date': self.report_date,
+            'fund_count': fund_count,
+            'success_count': success_count,
+            'report_notes': report_notes or []
+        }
+        for sink in sinks:
+            sink.close(context)
+        for sink in sinks:
+            sink.finish(context)
+        return context
+    
+    def run(self, days_to_keep=10, fund_codes=None, wencai_query=None, sinks=None):
+        """运行基金信号分析，分析结果逐个基金交给输出（默认CSV、Excel、信号索引和邮件）"""
+        logger.info("=" * 80)
+        logger.info("基金信号分析系统开始运行")
+        logger.info(f"报告日期：{self.report_date}")
+        logger.info(f"保留天数：{days_to_keep}")
+        logger.info("=" * 80)
+        
+        # 确定待分析基金列表
+        fund_codes, wencai_fund_data = self.resolve_fund_codes(fund_codes, wencai_query)
+        
+        # 只分析有新净值的基金，全部未更新时跳过本次分析
+        report_notes = []
+        if not self.force_refresh:
+            requested_count = len(fund_codes)
+            fund_codes = self.select_funds_to_refresh(fund_codes)
+            if not fund_codes:
+                logger.info("没有基金公布新净值，跳过本次分析")
+                return True
+            if len(fund_codes) < requested_count:
+                report_notes.append(f"净值未更新、本期未重新分析的基金：{requested_count - len(fund_codes)}个")
+        
+        # 有时间预算时按优先级排序，保证持仓、自选和数据最旧的基金先处理
+        if self.run_budget is not None:
+            signal_index = SignalIndex()
+            fund_codes = prioritize_funds(fund_codes, self.get_priority_codes(), signal_index.latest_nav_dates())
+            signal_index.close()
+        
+        if sinks is None:
+            sinks = self.create_default_sinks()
+        
+        # 只保留每个基金的轻量状态记录，信号明细直接交给输出，不在内存中累积
+        status_records = []
+        success_count = 0
+        latest_nav_date = ''
         
         # 开始分析
         start_time = time.time()
         logger.info("开始分析基金...")
         
-        for i, fund_code in enumerate(fund_codes, 1):
-            logger.debug(f"开始分析第{i}/{len(fund_codes)}个基金：{fund_code}")
-            result = self.analyze_fund(fund_code, i, len(fund_codes), start_time)
-            
-            if result is not None:
-                logger.debug(f"基金{fund_code}分析成功，添加到结果列表")
-                results.append(result)
-                
-                # 过滤近N天的数据
-                signal_df = result['signal_data'].copy()
-                
-                if '净值日期' in signal_df.columns:
-                    signal_df['净值日期'] = pd.to_datetime(signal_df['净值日期'])
-                    max_date = signal_df['净值日期'].max()
-                    cutoff_date = max_date - pd.Timedelta(days=days_to_keep)
-                    filtered_count = len(signal_df[signal_df['净值日期'] >= cutoff_date])
-                    logger.info(f"基金{fund_code}数据过滤：{filtered_count}/{len(signal_df)}条记录保留")
-                    
-                    signal_df = signal_df[signal_df['净值日期'] >= cutoff_date]
-                    signal_df['净值日期'] = signal_df['净值日期'].dt.strftime('%Y-%m-%d')
-                
-                # 从问财数据中更新基金简称和投资类型
-                if wencai_fund_data is not None:
-                    # 查找当前基金在问财数据中的信息
-                    fund_info = wencai_fund_data[wencai_fund_data['基金代码'] == fund_code]
-                    if not fund_info.empty:
-                        # 更新基金简称
-                        fund_name = fund_info['基金简称'].iloc[0]
-                        signal_df['基金简称'] = fund_name
-                        logger.info(f"更新基金{fund_code}简称为：{fund_name}")
-                        
-                        # 更新投资类型
-                        if '投资类型' in fund_info.columns:
-                            invest_type = fund_info['投资类型'].iloc[0]
-                            signal_df['投资类型'] = invest_type
-                            logger.info(f"更新基金{fund_code}投资类型为：{invest_type}")
-                
-                # 立即写入信号数据到CSV文件
-                logger.info(f"开始写入基金{fund_code}信号数据到CSV文件")
-                if first_write:
-                    # 第一次写入，包含表头
-                    signal_df.to_csv(csv_filename, index=False, encoding='utf-8-sig')
-                    first_write = False
-                else:
-                    # 后续写入，追加数据，不包含表头
-                    signal_df.to_csv(csv_filename, index=False, encoding='utf-8-sig', mode='a', header=False)
-                logger.debug(f"基金{fund_code}信号数据已写入CSV文件：{csv_filename}")
-                
-                # 立即写入信号数据到Excel文件
-                logger.info(f"开始写入基金{fund_code}信号数据到Excel文件")
-                try:
-                    if os.path.exists(excel_filename):
-                        # 文件已存在，读取现有数据并追加
-                        with pd.ExcelFile(excel_filename, engine='openpyxl') as xls:
-                            existing_df = pd.read_excel(xls, sheet_name='信号明细')
-                        combined_df = pd.concat([existing_df, signal_df], ignore_index=True)
-                    else:
-                        # 文件不存在，直接写入
-                        combined_df = signal_df
-                    
-                    with pd.ExcelWriter(excel_filename, engine='openpyxl') as writer:
-                        combined_df.to_excel(writer, sheet_name='信号明细', index=False)
-                    logger.debug(f"基金{fund_code}信号数据已写入Excel文件：{excel_filename}")
-                except Exception as e:
-                    logger.error(f"写入Excel文件失败：{str(e)}")
-                    logger.debug(f"异常详情：{repr(e)}")
-            else:
-                logger.warning(f"基金{fund_code}分析失败，跳过")
+        for fund_code, signal_df, daily_returns in self.iter_analyze(fund_codes, days_to_keep, wencai_fund_data, progress=True):
+            if signal_df is None:
+                status_records.append((fund_code, '失败', 0))
+                continue
             
-            # 避免请求过快，使用2-3秒的随机间隔
-            import random
-            sleep_time = random.uniform(1, 1.5)
-            logger.debug(f"等待{sleep_time:.2f}秒，避免API请求过快")
-            time.sleep(sleep_time)
+            status_records.append((fund_code, '成功', len(signal_df)))
+            success_count += 1
+            latest_nav_date = max(latest_nav_date, pd.to_datetime(signal_df['净值日期']).max().strftime('%Y-%m-%d'))
+            for sink in sinks:
+                sink.write(fund_code, signal_df, daily_returns=daily_returns)
+            # 输出处理完后立即释放本基金的数据
+            del signal_df, daily_returns
+        
+        if self.run_budget is not None and self.run_budget.skipped:
+            status_records.extend((code, '跳过', 0) for code in self.run_budget.skipped)
+            report_notes.append(self.format_skipped_note(self.run_budget.skipped))
+        self.last_run_status = pd.DataFrame(status_records, columns=['基金代码', '状态', '记录数'])
+        self.report_latency_stats()
         
         elapsed_time = time.time() - start_time
         sys.stdout.write("\n")
         logger.info("=" * 80)
-        logger.info(f"分析完成！成功: {len(results)}/{len(fund_codes)}")
+        logger.info(f"分析完成！成功: {success_count}/{len(fund_codes)}")
         logger.info(f"总耗时: {elapsed_time:.1f}秒")
         logger.info("=" * 80)
         
-        if not results:
+        context = self.close_sinks(sinks, len(fund_codes), success_count, report_notes)
+        
+        if not success_count:
             logger.error("没有成功分析任何基金，程序退出")
             return False
         
-        # 发送邮件
-        logger.info("开始发送邮件通知")
-        email_sent = self.email_sender.send_email(csv_filename, self.report_date)
-        if email_sent:
-            logger.info("邮件发送成功")
-        else:
-            logger.error("邮件发送失败")
+        # 记录本次成功报告，供下次运行做新鲜度检查；报告邮件生成失败时不记录
+        if not context.get('report_failed'):
+            self.run_state.save('funds', self.report_date, latest_nav_date, success_count)
         
         logger.info("=" * 80)
         logger.info("基金信号分析系统运行完成")
@@ -598,8 +793,200 @@ class FundSignalAnalyzer:
         
         return True
 
+    def calculate_indicators_batch(self, df):
+        """对多只基金的长表一次性计算技术指标和信号，口径与calculate_technical_indicators一致"""
+        if df is None or len(df) == 0:
+            logger.warning("数据为空，无法批量计算技术指标")
+            return df
+        
+        df = df.sort_values(['基金代码', '净值日期']).reset_index(drop=True)
+        logger.info(f"开始批量计算技术指标：基金{df['基金代码'].nunique()}个，数据{len(df)}条")
+        df = self.indicator_engine.compute(
+            df, self.indicator_names, group_key='基金代码', min_rows=self.BASIC_SIGNAL_MIN_ROWS
+        )
+        logger.info("批量技术指标计算和信号生成完成")
+        return df
+    
+    def get_fund_catalog(self):
+        """获取全部基金的简称和基金类型，失败时返回None"""
+        try:
+            catalog = self.retry_api_call(ak.fund_name_em, max_retries=3, base_delay=1)
+            catalog = catalog[['基金代码', '基金简称', '基金类型']].rename(columns={'基金类型': '投资类型'})
+            catalog['基金代码'] = catalog['基金代码'].astype(str)
+            logger.info(f"基金列表获取成功，共{len(catalog)}个基金")
+            return catalog.drop_duplicates('基金代码')
+        except Exception as e:
+            logger.warning(f"获取基金列表失败，投资类型将使用默认值：{str(e)}")
+            return None
+    
+    def run_full_market(self, days_to_keep=10, sinks=None, max_history_fetch=200):
+        """全市场模式：用一次全市场净值快照加本地历史净值批量计算全部开放式基金的信号
+        
+        只有本地没有历史、或历史与快照之间有缺口的基金才逐个请求历史数据，
+        每次运行最多请求max_history_fetch个（不大于0时不限制），其余在后续运行中补齐。
+        """
+        logger.info("=" * 80)
+        logger.info("基金信号分析系统开始运行（全市场模式）")
+        logger.info(f"报告日期：{self.report_date}")
+        logger.info(f"保留天数：{days_to_keep}")
+        logger.info("=" * 80)
+        
+        start_time = time.time()
+        
+        # 上次成功报告已包含最近交易日的净值时，不请求快照
+        last_nav_date = None if self.force_refresh else self.run_state.get('full_market').get('nav_date')
+        expected_date = self.trading_calendar.expected_nav_date() if last_nav_date else None
+        if expected_date and last_nav_date >= expected_date:
+            logger.info(f"上次成功报告已包含最近交易日{expected_date}的净值，跳过本次分析")
+            return True
+        
+        snapshot = self.get_daily_snapshot()
+        if snapshot is None:
+            logger.error("全市场净值快照获取失败，程序退出")
+            return False
+        daily_df, previous_date = self.parse_daily_snapshot(snapshot)
+        fund_codes = daily_df['基金代码'].drop_duplicates().tolist()
+        snapshot_date = daily_df['净值日期'].iloc[0].strftime('%Y-%m-%d')
+        logger.info(f"全市场基金{len(fund_codes)}个，最新净值日期：{snapshot_date}")
+        
+        if last_nav_date and snapshot_date <= last_nav_date:
+            logger.info(f"净值快照日期{snapshot_date}未晚于上次成功报告的净值日期{last_nav_date}，跳过本次分析")
+            return True
+        
+        # 参与计算和本地保留的历史条数至少覆盖请求指标声明的最长lookback
+        history_window = max(self.HISTORY_WINDOW, self.indicator_engine.lookback(self.indicator_names))
+        store_window = max(self.STORE_WINDOW, history_window)
+        
+        nav_store = NavStore()
+        latest_dates = nav_store.latest_dates()
+        stored_codes = set(latest_dates)
+        
+        # 本地没有历史或存在缺口的基金需要补齐历史数据
+        need_history = [
+            code for code in fund_codes
+            if code not in latest_dates or (previous_date is not None and latest_dates[code] < previous_date)
+        ]
+        if self.run_budget is not None:
+            need_history = prioritize_funds(need_history, self.get_priority_codes(), latest_dates)
+        if max_history_fetch > 0 and len(need_history) > max_history_fetch:
+            logger.info(f"需要补齐历史的基金{len(need_history)}个，本次补齐{max_history_fetch}个，其余在后续运行中补齐")
+            need_history = need_history[:max_history_fetch]
+        else:
+            logger.info(f"需要补齐历史的基金{len(need_history)}个")
+        
+        refetched = set()
+        for i, fund_code in enumerate(need_history, 1):
+            # 剩余时间不够时停止补齐，留出批量计算和发送邮件的时间
+            if self.run_budget is not None and not self.run_budget.can_dispatch():
+                self.run_budget.skip(need_history[i - 1:], stage="补齐历史")
+                break
+            fund_start = time.time()
+            self.show_progress(i, len(need_history), start_time, "补齐历史")
+            # 只有完整历史才写入本地存储，快照备选的一条净值会掩盖缺口，使该基金以后不再补齐
+            history_df = self.get_fund_data(fund_code, allow_fallback=False)
+            if history_df is not None:
+                nav_store.save(history_df.tail(store_window))
+                stored_codes.add(fund_code)
+                refetched.add(fund_code)
+            if i < len(need_history) and self.request_interval[1] > 0:
+                time.sleep(random.uniform(*self.request_interval))
+            if self.run_budget is not None:
+                self.run_budget.record(time.time() - fund_start)
+        if need_history:
+            sys.stdout.write("\n")
+            self.report_latency_stats()
+        
+        # 快照中的当日净值只写入历史已连续到快照上一净值日期（或本次刚补齐）的基金，
+        # 尚未补齐的新基金和有缺口的基金保持原状，后续运行中仍会被识别为需要补齐
+        contiguous_codes = refetched | {
+            code for code, latest_date in latest_dates.items()
+            if previous_date is None or latest_date >= previous_date
+        }
+        saved = nav_store.save(daily_df[daily_df['基金代码'].isin(contiguous_codes)])
+        nav_store.prune(store_window)
+        logger.info(f"当日净值已写入本地存储：{saved}条")
+        
+        # 只分析本地已有历史的基金
+        ready_codes = [code for code in fund_codes if code in stored_codes]
+        
+        # 只重新分析本地净值晚于上次处理日期的基金
+        report_notes = []
+        if not self.force_refresh:
+            signal_index = SignalIndex()
+            processed_dates = signal_index.latest_nav_dates()
+            signal_index.close()
+            changed_codes = select_changed_funds(ready_codes, nav_store.latest_dates(), processed_dates)
+            logger.info(f"净值新鲜度检查：有新净值的基金{len(changed_codes)}个，净值未更新的基金{len(ready_codes) - len(changed_codes)}个")
+            if len(changed_codes) < len(ready_codes):
+                report_notes.append(f"净值未更新、本期未重新分析的基金：{len(ready_codes) - len(changed_codes)}个")
+            ready_codes = changed_codes
+            if not ready_codes:
+                nav_store.close()
+                logger.info("没有基金公布新净值，跳过本次分析")
+                return True
+        
+        histories = nav_store.load_histories(ready_codes, window=history_window)
+        nav_store.close()
+        logger.info(f"本地历史净值加载完成：基金{histories['基金代码'].nunique()}个，数据{len(histories)}条")
+        
+        if histories.empty:
+            logger.error("本地没有可用的历史净值，程序退出")
+            return False
+        
+        # 合并基金简称和投资类型
+        fund_info = self.get_fund_catalog()
+        if fund_info is None:
+            fund_info = daily_df[['基金代码', '基金简称']].drop_duplicates('基金代码').assign(投资类型='未知类型')
+        histories = histories.merge(fund_info, on='基金代码', how='left')
+        histories['基金简称'] = histories['基金简称'].fillna('基金' + histories['基金代码'])
+        histories['投资类型'] = histories['投资类型'].fillna('未知类型')
+        
+        # 批量计算全部基金的技术指标
+        fund_df = self.calculate_indicators_batch(histories)
+        signal_df = self.create_signal_table(fund_df, '全市场')
+        signal_df = self.add_timeframe_signals(fund_df, signal_df, '全市场', group_key='基金代码')
+        
+        # 过滤每个基金（多周期模式下每个基金每个周期）近N天的数据
+        nav_dates = pd.to_datetime(signal_df['净值日期'])
+        group_keys = [signal_df['基金代码']] + ([signal_df['周期']] if '周期' in signal_df.columns else [])
+        cutoff = nav_dates.groupby(group_keys).transform('max') - pd.Timedelta(days=days_to_keep)
+        signal_df = signal_df[nav_dates >= cutoff]
+        
+        if sinks is None:
+            sinks = self.create_default_sinks()
+        
+        success_count = 0
+        raw_groups = fund_df.groupby('基金代码', sort=False)
+        for fund_code, fund_signals in signal_df.groupby('基金代码', sort=False):
+            daily_returns = self.extract_daily_returns(raw_groups.get_group(fund_code))
+            for sink in sinks:
+                sink.write(fund_code, fund_signals, daily_returns=daily_returns)
+            success_count += 1
+        
+        elapsed_time = time.time() - start_time
+        logger.info("=" * 80)
+        logger.info(f"全市场分析完成！成功: {success_count}/{len(fund_codes)}")
+        logger.info(f"总耗时: {elapsed_time:.1f}秒")
+        logger.info("=" * 80)
+        
+        if self.run_budget is not None and self.run_budget.skipped:
+            report_notes.append(self.format_skipped_note(self.run_budget.skipped, action="补齐历史净值"))
+        context = self.close_sinks(sinks, len(fund_codes), success_count, report_notes)
+        
+        if success_count > 0 and not context.get('report_failed'):
+            # 记录本次成功报告，供下次运行做新鲜度检查；报告邮件生成失败时不记录
+            self.run_state.save('full_market', self.report_date, snapshot_date, success_count)
+        
+        logger.info("=" * 80)
+        logger.info("基金信号分析系统运行完成")
+        logger.info("=" * 80)
+        
+        return success_count > 0
+
 def main():
     """主函数，带完善的异常处理"""
+    # 时间预算从程序启动开始计算
+    process_start = time.time()
     try:
         # 解析命令行参数
         parser = argparse.ArgumentParser(description='基金信号分析系统')
@@ -607,10 +994,61 @@ def main():
         parser.add_argument('--funds', type=str, help='基金代码列表，用逗号分隔')
         parser.add_argument('--wencai', type=str, help='问财选股查询语句，例如：场外基金近1年涨幅top100，基金类型，c类')
         parser.add_argument('--test-email', action='store_true', help='测试邮件发送')
+        parser.add_argument('--full-market', action='store_true', help='全市场模式：基于全市场净值快照和本地历史净值分析全部开放式基金')
+        parser.add_argument('--max-history-fetch', type=int, default=200, help='全市场模式每次运行最多补齐历史数据的基金数，不大于0时不限制')
+        parser.add_argument('--indicators', type=str, help='需要计算的指标，用逗号分隔，例如：boll,macd,score，默认全部')
+        parser.add_argument('--timeframes', type=str, default='D', help='信号周期，用逗号分隔：D日线、W周线、M月线，例如：D,W,M')
+        parser.add_argument('--top-n', type=int, default=5, help='邮件中每个投资类型展示综合评分最高和最低的基金数')
+        parser.add_argument('--corr-threshold', type=float, default=0.95, help='相似基金聚类的日收益率相关系数阈值，不大于0时不聚类')
+        parser.add_argument('--corr-memory-mb', type=int, default=256, help='相关系数分块计算的内存预算（MB）')
+        parser.add_argument('--serve', action='store_true', help='以常驻服务模式运行，提供本地HTTP信号查询接口')
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='服务模式监听地址')
+        parser.add_argument('--port', type=int, default=8765, help='服务模式监听端口')
+        parser.add_argument('--refresh-at', type=str, default='22:00', help='服务模式每日刷新时间，格式HH:MM，应晚于净值公布时间')
+        parser.add_argument('--history', type=str, help='查询指定基金的信号变化记录，例如：110020')
+        parser.add_argument('--start', type=str, help='信号变化查询开始日期，格式YYYY-MM-DD')
+        parser.add_argument('--end', type=str, help='信号变化查询结束日期，格式YYYY-MM-DD')
+        parser.add_argument('--force', action='store_true', help='不做净值新鲜度检查，重新分析全部基金')
+        parser.add_argument('--budget', type=str, help='全局运行时间预算，例如25m、1h、900s，超出前停止分析并留出收尾时间')
+        parser.add_argument('--finalize-reserve', type=int, default=120, help='时间预算中为写出结果和发送邮件预留的秒数')
+        parser.add_argument('--profile', nargs='?', const='run', choices=['run', 'fund'],
+                            help='性能分析：run分析整个运行过程，fund逐个基金分析analyze_fund，结果写到output目录')
+        parser.add_argument('--flush-outbox', action='store_true', help='只发送发件箱中未发出的邮件，不运行分析')
+        parser.add_argument('--outbox-timeout', type=int, default=300, help='分析完成后等待发件箱发送完毕的最长秒数')
+        parser.add_argument('--request-interval', type=str, help='相邻两次基金数据请求之间的随机等待区间（秒），例如1,1.5，0表示不等待')
         args = parser.parse_args()
+        if args.profile == 'fund' and args.full_market:
+            # 全市场模式批量计算全部基金，不调用analyze_fund，fund模式不会产生任何结果
+            parser.error("--profile fund不支持--full-market，全市场模式请使用--profile run")
+        
+        # 查询信号变化记录，只读索引，不需要初始化分析器
+        if args.history:
+            fund_code = SignalIndex.normalize_code(args.history)
+            signal_index = SignalIndex()
+            transitions = signal_index.get_transitions(fund_code, args.start, args.end)
+            signal_index.close()
+            if transitions.empty:
+                print(f"基金{fund_code}在指定区间内没有信号变化记录")
+            else:
+                print(f"基金{fund_code}信号变化记录（共{len(transitions)}条）：")
+                print(transitions.to_string(index=False))
+            return
         
         # 初始化分析器
         analyzer = FundSignalAnalyzer()
+        analyzer.corr_threshold = args.corr_threshold
+        analyzer.corr_memory_mb = args.corr_memory_mb
+        analyzer.top_n = args.top_n
+        analyzer.force_refresh = args.force
+        analyzer.timeframes = parse_timeframes(args.timeframes)
+        if args.budget:
+            analyzer.run_budget = RunBudget(parse_duration(args.budget), args.finalize_reserve, start_time=process_start)
+            logger.info(f"运行时间预算：{args.budget}，收尾预留{args.finalize_reserve}秒")
+        if args.request_interval:
+            interval = [float(value) for value in args.request_interval.split(',') if value.strip()]
+            analyzer.request_interval = (interval[0], interval[-1])
+        if args.indicators:
+            analyzer.indicator_names = [name.strip() for name in args.indicators.split(',') if name.strip()]
         
         # 测试邮件发送
         if args.test_email:
@@ -647,6 +1085,11 @@ def main():
             # 将return语句移到finally块外面
             return
         
+        # 只发送发件箱中积压的邮件
+        if args.flush_outbox:
+            analyzer.outbox.flush(timeout=args.outbox_timeout)
+            return
+        
         # 解析基金代码列表
         fund_codes = None
         if args.funds:
@@ -665,9 +1108,47 @@ def main():
             if wencai_query:
                 logger.info(f"从环境变量获取问财查询语句：{wencai_query}")
         
-        # 运行分析
-        logger.info("开始运行基金信号分析")
-        analyzer.run(days_to_keep=args.days, fund_codes=fund_codes, wencai_query=wencai_query)
+        # 服务模式：常驻内存，定时刷新并提供本地查询接口
+        if args.serve:
+            from service import FundSignalService
+            service = FundSignalService(
+                analyzer,
+                fund_codes=fund_codes,
+                wencai_query=wencai_query,
+                days_to_keep=args.days,
+                refresh_at=args.refresh_at,
+                host=args.host,
+                port=args.port
+            )
+            service.serve_forever()
+            return
+        
+        # 性能分析只在指定--profile时加载和挂载
+        profiler = None
+        if args.profile:
+            from profiling import RunProfiler
+            profiler = RunProfiler(os.path.join(os.getcwd(), 'output'), analyzer.report_date, mode=args.profile)
+            profiler.attach(analyzer)
+            profiler.start()
+        
+        try:
+            # 全市场模式
+            if args.full_market:
+                logger.info("开始运行全市场基金信号分析")
+                analyzer.run_full_market(days_to_keep=args.days, max_history_fetch=args.max_history_fetch)
+            else:
+                # 运行分析
+                logger.info("开始运行基金信号分析")
+                analyzer.run(days_to_keep=args.days, fund_codes=fund_codes, wencai_query=wencai_query)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        
+        # 分析已完成，进程退出前等待后台发件箱发送，未发出的邮件下次运行时继续发送
+        outbox_timeout = args.outbox_timeout
+        if analyzer.run_budget is not None:
+            outbox_timeout = analyzer.run_budget.finalize_timeout(outbox_timeout)
+        analyzer.outbox.flush(timeout=outbox_timeout)
         
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
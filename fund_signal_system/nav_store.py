@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import pandas as pd
+from logger import logger
+
+
+class NavStore:
+    """基金历史净值本地存储
+
+    全市场模式下每天只用一次全市场行情请求补充当日净值，
+    只有新基金或净值有缺口的基金才重新请求历史数据。
+    """
+
+    def __init__(self, db_path=None):
+        """初始化净值存储，数据库默认位于 data/nav_store.db"""
+        if db_path is None:
+            db_path = os.path.join(os.getcwd(), 'data', 'nav_store.db')
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fund_nav (
+                fund_code TEXT NOT NULL,
+                nav_date TEXT NOT NULL,
+                nav REAL NOT NULL,
+                growth REAL,
+                PRIMARY KEY (fund_code, nav_date)
+            )
+        """)
+        self.conn.commit()
+        logger.info(f"净值存储已加载：{db_path}")
+
+    def latest_dates(self):
+        """获取每个基金已存储的最新净值日期"""
+        rows = self.conn.execute("SELECT fund_code, MAX(nav_date) FROM fund_nav GROUP BY fund_code")
+        return dict(rows.fetchall())
+
+    def save(self, nav_df):
+        """保存净值数据，nav_df需包含基金代码、净值日期、最新净值、日增长率%列"""
+        if nav_df is None or nav_df.empty:
+            return 0
+
+        data = nav_df[['基金代码', '净值日期', '最新净值', '日增长率%']].copy()
+        data['净值日期'] = pd.to_datetime(data['净值日期'], errors='coerce').dt.strftime('%Y-%m-%d')
+        data['最新净值'] = pd.to_numeric(data['最新净值'], errors='coerce')
+        data['日增长率%'] = pd.to_numeric(data['日增长率%'], errors='coerce')
+        data = data.dropna(subset=['净值日期', '最新净值'])
+        data = data.astype(object).where(data.notna(), None)
+
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fund_nav VALUES (?, ?, ?, ?)",
+            data.itertuples(index=False, name=None)
+        )
+        self.conn.commit()
+        return len(data)
+
+    def load_histories(self, fund_codes=None, window=250):
+        """读取每个基金最近window条净值，返回按基金代码和净值日期排序的长表"""
+        query = """
+            SELECT fund_code AS 基金代码, nav_date AS 净值日期, nav AS 最新净值, growth AS "日增长率%"
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY fund_code ORDER BY nav_date DESC) AS rn
+                FROM fund_nav
+            )
+            WHERE rn <= ?
+            ORDER BY fund_code, nav_date
+        """
+        histories = pd.read_sql_query(query, self.conn, params=(window,))
+        if fund_codes is not None:
+            histories = histories[histories['基金代码'].isin(set(fund_codes))]
+        histories['净值日期'] = pd.to_datetime(histories['净值日期'])
+        return histories.reset_index(drop=True)
+
+    def prune(self, keep=500):
+        """每个基金只保留最近keep条净值，控制存储大小"""
+        self.conn.execute("""
+            DELETE FROM fund_nav WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (PARTITION BY fund_code ORDER BY nav_date DESC) AS rn
+                    FROM fund_nav
+                ) WHERE rn > ?
+            )
+        """, (keep,))
+        self.conn.commit()
+
+    def close(self):
+        """关闭存储数据库连接"""
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import threading
+from email import message_from_binary_file, policy
+from logger import logger
+
+
+class EmailOutbox:
+    """本地邮件发件箱
+
+    报告邮件先写入 data/outbox 目录（.eml 邮件 + .json 发送状态），再由后台线程发送。
+    后台线程复用同一个SMTP连接，失败时按指数退避重试，超过最大次数的邮件移到 failed 子目录；
+    进程退出时未发出的邮件留在发件箱，下次运行时继续发送。
+    """
+
+    def __init__(self, email_sender, spool_dir=None, max_attempts=5, base_delay=5, max_delay=300):
+        """初始化发件箱"""
+        if spool_dir is None:
+            spool_dir = os.path.join(os.getcwd(), 'data', 'outbox')
+        self.email_sender = email_sender
+        self.spool_dir = spool_dir
+        # 目录在第一次写入邮件时创建，只创建分析器不会写磁盘
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._server = None
+        self.sent_count = 0
+
+    def _paths(self, message_id):
+        return (os.path.join(self.spool_dir, f'{message_id}.eml'),
+                os.path.join(self.spool_dir, f'{message_id}.json'))
+
+    @staticmethod
+    def _write_atomic(path, data):
+        """先写临时文件再替换，避免进程中断时留下半个文件"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def enqueue(self, msg, recipients):
+        """把邮件写入发件箱，返回邮件ID"""
+        message_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.spool_dir, exist_ok=True)
+        eml_path, meta_path = self._paths(message_id)
+        self._write_atomic(eml_path, msg.as_bytes())
+        # 状态文件最后写入，有状态文件的邮件才会被发送
+        self._write_atomic(meta_path, json.dumps({
+            'recipients': list(recipients),
+            'subject': str(msg['Subject']),
+            'attempts': 0,
+            'next_attempt': 0,
+            'last_error': None
+        }, ensure_ascii=False).encode('utf-8'))
+        logger.info(f"邮件已加入发件箱：{message_id}，收件人：{','.join(recipients)}")
+        self._wakeup.set()
+        return message_id
+
+    def pending(self):
+        """发件箱中待发送的邮件ID，按入队时间排序"""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+
+    def _load_meta(self, message_id):
+        with open(self._paths(message_id)[1], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _close_connection(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _send_one(self, message_id, meta):
+        """发送单封邮件，连接断开时重连一次"""
+        eml_path, meta_path = self._paths(message_id)
+        with open(eml_path, 'rb') as f:
+            msg = message_from_binary_file(f, policy=policy.SMTP)
+
+        for attempt in range(2):
+            if self._server is None:
+                self._server = self.email_sender.open_connection()
+            try:
+                self._server.send_message(msg, to_addrs=meta['recipients'])
+                break
+            except Exception:
+                # 复用的连接可能已被服务器关闭，重连后再试一次
+                self._close_connection()
+                if attempt == 1:
+                    raise
+
+        os.remove(meta_path)
+        os.remove(eml_path)
+        self.sent_count += 1
+        logger.info(f"发件箱邮件发送成功：{message_id}，收件人：{','.join(meta['recipients'])}")
+
+    def process_pending(self):
+        """发送到期的全部邮件，返回下一封邮件的等待秒数（没有待发邮件时返回None）"""
+        next_wait = None
+        for message_id in self.pending():
+            if self._stop_event.is_set():
+                break
+            try:
+                meta = self._load_meta(message_id)
+            except Exception as e:
+                logger.error(f"读取发件箱邮件{message_id}状态失败：{str(e)}")
+                continue
+
+            wait = meta['next_attempt'] - time.time()
+            if wait > 0:
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                continue
+
+            try:
+                self._send_one(message_id, meta)
+            except Exception as e:
+                meta['attempts'] += 1
+                meta['last_error'] = str(e)
+                if meta['attempts'] >= self.max_attempts:
+                    logger.error(f"发件箱邮件{message_id}发送失败{meta['attempts']}次，移到failed目录：{str(e)}")
+                    os.makedirs(self.failed_dir, exist_ok=True)
+                    for path in self._paths(message_id)[::-1]:
+                        os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+                    continue
+
+                delay = min(self.base_delay * (2 ** (meta['attempts'] - 1)), self.max_delay)
+                meta['next_attempt'] = time.time() + delay
+                self._write_atomic(self._paths(message_id)[1], json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+                logger.warning(f"发件箱邮件{message_id}第{meta['attempts']}次发送失败，{delay}秒后重试：{str(e)}")
+                next_wait = delay if next_wait is None else min(next_wait, delay)
+        return next_wait
+
+    def _run(self):
+        """后台发送线程"""
+        try:
+            while not self._stop_event.is_set():
+                self._wakeup.clear()
+                next_wait = self.process_pending()
+                if next_wait is None and not self.pending():
+                    # 发件箱已空，关闭连接等待新邮件
+                    self._close_connection()
+                self._wakeup.wait(next_wait)
+        finally:
+            self._close_connection()
+
+    def start(self):
+        """启动后台发送线程"""
+        if self._thread is not None and self._thread.is_alive():
+            self._wakeup.set()
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+        self._thread.start()
+        logger.info(f"发件箱后台发送已启动，待发送邮件{len(self.pending())}封")
+
+    def flush(self, timeout=None):
+        """等待发件箱发送完毕或超时，返回是否已全部发送"""
+        deadline = None if timeout is None else time.time() + timeout
+        self.start()
+        while self.pending():
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(0.2)
+        remaining = len(self.pending())
+        self.stop()
+        if remaining:
+            logger.warning(f"发件箱仍有{remaining}封邮件未发送，将在下次运行时继续发送")
+        else:
+            logger.info(f"发件箱邮件已全部发送，本次发送{self.sent_count}封")
+        return remaining == 0
+
+    def stop(self):
+        """停止后台发送线程"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
@@ -0,0 +1,153 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from logger import logger
+
+
+class StackSampler:
+    """采样线程：定时采集所有线程的调用栈，输出火焰图工具可用的折叠栈格式"""
+
+    # 空闲线程的栈顶函数（等待任务或事件），这些样本不计入
+    IDLE_FRAMES = {('wait', 'threading.py'), ('_worker', 'thread.py')}
+
+    def __init__(self, interval=0.005):
+        """初始化采样器，interval为采样间隔（秒）"""
+        self.interval = interval
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if (frame.f_code.co_name, os.path.basename(frame.f_code.co_filename)) in self.IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[';'.join(reversed(labels))] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """开始采样"""
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_collapsed(self, path):
+        """写出折叠栈文件，每行"栈;栈 次数"，可直接用flamegraph.pl或speedscope打开"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfiler:
+    """运行性能分析，只在--profile时创建，未启用时不产生任何开销
+
+    run模式：cProfile确定性分析整个运行过程，同时采样调用栈；
+    fund模式：每个基金的analyze_fund单独用cProfile分析，保存最慢的若干个基金，运行过程只做采样。
+    结果写到output目录：.prof（pstats格式）、.collapsed（折叠栈）和.txt（耗时排行摘要）。
+    """
+
+    def __init__(self, output_dir, report_date, mode='run', interval=0.005, top_funds=10):
+        """初始化性能分析"""
+        self.output_dir = output_dir
+        self.prefix = os.path.join(output_dir, f'profile_{report_date}')
+        self.mode = mode
+        self.top_funds = top_funds
+        self.sampler = StackSampler(interval)
+        self.profiler = cProfile.Profile() if mode == 'run' else None
+        self.fund_profiles = []
+        self.start_time = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def attach(self, analyzer):
+        """fund模式下替换分析器实例的analyze_fund，逐个基金记录性能数据"""
+        if self.mode != 'fund':
+            return
+        analyze_fund = analyzer.analyze_fund
+
+        def profiled_analyze_fund(fund_code, *args, **kwargs):
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            result = profile.runcall(analyze_fund, fund_code, *args, **kwargs)
+            self.fund_profiles.append((time.perf_counter() - start, fund_code, profile))
+            # 只保留最慢的若干个基金，避免基金多时占用内存
+            self.fund_profiles.sort(key=lambda item: item[0], reverse=True)
+            del self.fund_profiles[self.top_funds:]
+            return result
+
+        analyzer.analyze_fund = profiled_analyze_fund
+
+    def start(self):
+        """开始性能分析"""
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        logger.info(f"性能分析已启用（{self.mode}模式），采样间隔{self.sampler.interval * 1000:.0f}毫秒")
+
+    @staticmethod
+    def _write_summary(stats, path, title, limit=40):
+        buffer = io.StringIO()
+        stats.stream = buffer
+        stats.sort_stats('cumulative').print_stats(limit)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{title}\n\n{buffer.getvalue()}")
+
+    def stop(self):
+        """停止性能分析并写出结果文件，返回文件路径列表"""
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.sampler.stop()
+        elapsed = time.perf_counter() - self.start_time
+
+        paths = []
+        try:
+            collapsed_path = f'{self.prefix}.collapsed'
+            self.sampler.write_collapsed(collapsed_path)
+            paths.append(collapsed_path)
+
+            if self.profiler is not None:
+                prof_path = f'{self.prefix}.prof'
+                self.profiler.dump_stats(prof_path)
+                summary_path = f'{self.prefix}.txt'
+                self._write_summary(pstats.Stats(self.profiler), summary_path, f"运行耗时：{elapsed:.1f}秒")
+                paths.extend([prof_path, summary_path])
+
+            for seconds, fund_code, profile in self.fund_profiles:
+                prof_path = f'{self.prefix}_fund_{fund_code}.prof'
+                profile.dump_stats(prof_path)
+                summary_path = f'{self.prefix}_fund_{fund_code}.txt'
+                self._write_summary(pstats.Stats(profile), summary_path, f"基金{fund_code}分析耗时：{seconds:.2f}秒")
+                paths.extend([prof_path, summary_path])
+        except Exception as e:
+            logger.error(f"写出性能分析结果失败：{str(e)}")
+
+        logger.info(f"性能分析完成：耗时{elapsed:.1f}秒，采样{self.sampler.sample_count}次，结果文件：{paths}")
+        return paths
@@ -0,0 +1,83 @@
+import re
+import time
+from logger import logger
+
+
+def parse_duration(text):
+    """解析时长字符串，例如25m、90s、1h、1h30m，纯数字按秒计算"""
+    text = str(text).strip().lower()
+    if re.fullmatch(r'\d+(\.\d+)?', text):
+        return float(text)
+
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([hms])', text)
+    if not parts or ''.join(f'{n}{u}' for n, u in parts) != re.sub(r'\s+', '', text):
+        raise ValueError(f"无法解析时长：{text}，示例：25m、90s、1h30m")
+    units = {'h': 3600, 'm': 60, 's': 1}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def prioritize_funds(fund_codes, priority_codes=None, processed_dates=None):
+    """按优先级排序基金：持仓和自选基金优先，其次是数据最旧（或从未处理）的基金，最后是其余基金
+
+    同一优先级内保持原有顺序。
+    """
+    priority_codes = {code.split('.')[0] for code in priority_codes or []}
+    processed_dates = processed_dates or {}
+    latest = max(processed_dates.values(), default='')
+
+    def sort_key(item):
+        position, code = item
+        if code.split('.')[0] in priority_codes:
+            return (0, '', position)
+        processed = processed_dates.get(code, '')
+        if processed < latest or not processed:
+            return (1, processed, position)
+        return (2, '', position)
+
+    return [code for _, code in sorted(enumerate(fund_codes), key=sort_key)]
+
+
+class RunBudget:
+    """全局运行时间预算
+
+    用每个基金耗时的指数加权平均估算下一个基金的耗时，
+    剩余时间扣除收尾预留后不够处理下一个基金时停止派发，保证有时间写出结果和发送邮件。
+    """
+
+    def __init__(self, budget_seconds, finalize_reserve=120, alpha=0.3, start_time=None):
+        """初始化运行预算，start_time默认为当前时间"""
+        self.start_time = start_time or time.time()
+        self.deadline = self.start_time + budget_seconds
+        self.finalize_reserve = finalize_reserve
+        self.alpha = alpha
+        self.avg_fund_seconds = None
+        self.skipped = []
+
+    def remaining(self):
+        """距离截止时间的剩余秒数"""
+        return self.deadline - time.time()
+
+    def record(self, seconds):
+        """记录一个基金的处理耗时"""
+        if self.avg_fund_seconds is None:
+            self.avg_fund_seconds = seconds
+        else:
+            self.avg_fund_seconds = self.alpha * seconds + (1 - self.alpha) * self.avg_fund_seconds
+
+    def can_dispatch(self):
+        """剩余时间扣除收尾预留后是否还够处理下一个基金"""
+        estimate = self.avg_fund_seconds or 0
+        return self.remaining() - self.finalize_reserve >= estimate
+
+    def skip(self, fund_codes, stage="分析"):
+        """记录因时间预算不足未处理的基金"""
+        if not fund_codes:
+            return
+        self.skipped.extend(fund_codes)
+        logger.warning(f"剩余时间{self.remaining():.0f}秒，预留收尾{self.finalize_reserve}秒，"
+                       f"按平均每个基金{self.avg_fund_seconds or 0:.1f}秒估算不足以继续，"
+                       f"停止{stage}，跳过{len(fund_codes)}个基金")
+
+    def finalize_timeout(self, default):
+        """收尾阶段（如等待邮件发送）的最长等待时间，不超过剩余时间"""
+        return max(0, min(default, self.remaining()))
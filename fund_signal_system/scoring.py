@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from logger import logger
+
+
+def add_composite_score(df):
+    """根据RSI、cci值、macd值和布林带位置计算综合评分，取值范围-100~100
+
+    各指标按与现有信号相同的方向折算到-1~1：RSI、CCI越低、净值越接近布林带下轨、
+    MACD相对净值越低，越接近超卖/买入区间，评分越高；四项等权平均后乘以100。
+    """
+    nav = df['最新净值'].astype(float)
+    band_width = df['布林带上轨值'] - df['布林带下轨值']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['布林带位置'] = ((nav - df['布林带下轨值']) / band_width).replace([np.inf, -np.inf], np.nan).round(4)
+        macd_pct = df['macd值'] / df['布林带中轨值'] * 100
+
+    components = pd.DataFrame({
+        'rsi': ((50 - df['RSI']) / 50).clip(-1, 1),
+        'cci': (-df['cci值'] / 200).clip(-1, 1),
+        'macd': -np.tanh(macd_pct),
+        'boll': (1 - 2 * df['布林带位置']).clip(-1, 1)
+    }, index=df.index).fillna(0)
+
+    df['综合评分'] = (components.mean(axis=1) * 100).round(2)
+    return df
+
+
+def rank_funds(signal_df, group_column='投资类型', by_date=True):
+    """对综合评分做投资类型内的横截面排名，by_date为True时每个净值日期单独排名
+
+    返回带有综合排名（1为评分最高）、同类基金数和同类百分位列的副本。
+    """
+    ranked = signal_df.copy()
+    if group_column not in ranked.columns:
+        ranked[group_column] = '未知类型'
+    ranked[group_column] = ranked[group_column].fillna('未知类型')
+    keys = [ranked['净值日期'], ranked[group_column]] if by_date else [ranked[group_column]]
+    if '周期' in ranked.columns:
+        # 多周期模式下不同周期的信号分别排名
+        keys.append(ranked['周期'])
+
+    grouped = ranked.groupby(keys, sort=False)['综合评分']
+    ranked['综合排名'] = grouped.rank(ascending=False, method='min').astype('Int64')
+    ranked['同类基金数'] = grouped.transform('count')
+    ranked['同类百分位'] = grouped.rank(pct=True).round(4)
+    return ranked
+
+
+def top_bottom_funds(ranked_df, top_n=5, group_column='投资类型'):
+    """取每个投资类型评分最高和最低的N个基金，返回{投资类型: (前N, 后N)}"""
+    result = {}
+    for invest_type, group in ranked_df.groupby(group_column, sort=True):
+        group = group.sort_values('综合评分', ascending=False)
+        top = group.head(top_n)
+        bottom = group.iloc[len(top):].tail(top_n).sort_values('综合评分')
+        result[invest_type] = (top, bottom)
+    logger.info(f"综合评分排名完成：投资类型{len(result)}个，基金{len(ranked_df)}个")
+    return result
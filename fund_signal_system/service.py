@@ -0,0 +1,222 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from logger import logger
+from timeframes import daily_rows
+
+
+class FundSignalService:
+    """基金信号常驻服务
+
+    保持分析器常驻内存，缓存基金净值和信号结果，每日在净值公布后定时刷新，
+    并通过本地HTTP接口提供查询。未缓存的基金在首次查询时即时计算并加入缓存。
+    """
+
+    def __init__(self, analyzer, fund_codes=None, wencai_query=None, days_to_keep=10,
+                 refresh_at="22:00", host="127.0.0.1", port=8765):
+        """初始化服务"""
+        self.analyzer = analyzer
+        self.fund_codes = fund_codes
+        self.wencai_query = wencai_query
+        self.days_to_keep = days_to_keep
+        self.refresh_at = datetime.strptime(refresh_at, '%H:%M').time()
+        self.host = host
+        self.port = port
+
+        # 内存缓存：基金代码 -> 净值数据 / 信号结果
+        self.nav_cache = {}
+        self.signal_cache = {}
+        self.wencai_fund_data = None
+        self.last_refresh = None
+
+        self._cache_lock = threading.Lock()
+        self._fund_locks = {}
+        self._stop_event = threading.Event()
+        self.httpd = None
+
+    @staticmethod
+    def normalize_code(fund_code):
+        """去掉基金代码的.OF等后缀"""
+        return str(fund_code).strip().split('.')[0]
+
+    def _get_fund_lock(self, fund_code):
+        """获取单个基金的计算锁，避免同一基金被并发重复计算"""
+        with self._cache_lock:
+            if fund_code not in self._fund_locks:
+                self._fund_locks[fund_code] = threading.Lock()
+            return self._fund_locks[fund_code]
+
+    def compute_fund(self, fund_code, refetch=False):
+        """计算单个基金的信号并写入缓存，失败返回None"""
+        fund_code = self.normalize_code(fund_code)
+
+        with self._get_fund_lock(fund_code):
+            nav_df = None if refetch else self.nav_cache.get(fund_code)
+            if nav_df is None:
+                nav_df = self.analyzer.get_fund_data(fund_code)
+                if nav_df is None:
+                    logger.warning(f"基金{fund_code}数据获取失败，无法计算信号")
+                    return None
+
+            try:
+                # 指标计算会在数据上追加列，使用副本保持净值缓存干净
+                fund_df = self.analyzer.calculate_technical_indicators(nav_df.copy())
+                signal_df = self.analyzer.create_signal_table(fund_df, fund_code)
+                signal_df = self.analyzer.add_timeframe_signals(fund_df, signal_df, fund_code)
+                signal_df = self.analyzer.filter_recent_signals(signal_df, fund_code, self.days_to_keep)
+                self.analyzer.apply_fund_info(signal_df, fund_code, self.wencai_fund_data)
+            except Exception as e:
+                logger.error(f"计算基金{fund_code}信号失败：{str(e)}")
+                return None
+
+            entry = {
+                'fund_code': fund_code,
+                'signal_data': signal_df,
+                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            with self._cache_lock:
+                self.nav_cache[fund_code] = nav_df
+                self.signal_cache[fund_code] = entry
+            return entry
+
+    def get_signals(self, fund_code):
+        """查询基金信号，优先使用缓存，未缓存时即时计算"""
+        fund_code = self.normalize_code(fund_code)
+        entry = self.signal_cache.get(fund_code)
+        if entry is not None:
+            return entry, True
+        logger.info(f"基金{fund_code}未缓存，即时计算")
+        return self.compute_fund(fund_code), False
+
+    def refresh_all(self):
+        """刷新全部已跟踪基金的净值和信号"""
+        self.analyzer.report_date = datetime.now().strftime('%Y-%m-%d')
+        logger.info(f"开始刷新基金信号缓存，报告日期：{self.analyzer.report_date}")
+
+        # 每次刷新重新确定基金列表，按需查询过的基金也一并刷新
+        fund_codes, self.wencai_fund_data = self.analyzer.resolve_fund_codes(self.fund_codes, self.wencai_query)
+        codes = [self.normalize_code(code) for code in fund_codes]
+        codes = list(dict.fromkeys(codes + list(self.signal_cache.keys())))
+
+        start_time = time.time()
+        success = 0
+        request_interval = self.analyzer.request_interval
+        for i, fund_code in enumerate(codes, 1):
+            if self._stop_event.is_set():
+                break
+            if self.compute_fund(fund_code, refetch=True) is not None:
+                success += 1
+            # 与run相同，相邻两次请求之间随机等待，避免请求过快；停止服务时立即结束等待
+            if i < len(codes) and request_interval[1] > 0:
+                self._stop_event.wait(random.uniform(*request_interval))
+
+        self.last_refresh = datetime.now()
+        self.analyzer.report_latency_stats()
+        logger.info(f"缓存刷新完成：成功{success}/{len(codes)}，耗时{time.time() - start_time:.1f}秒")
+
+    def _next_refresh_time(self, now=None):
+        """计算下一次定时刷新的时间"""
+        now = now or datetime.now()
+        next_time = datetime.combine(now.date(), self.refresh_at)
+        if next_time <= now:
+            next_time += timedelta(days=1)
+        return next_time
+
+    def _refresh_loop(self):
+        """后台定时刷新线程"""
+        while not self._stop_event.is_set():
+            next_time = self._next_refresh_time()
+            logger.info(f"下一次缓存刷新时间：{next_time.strftime('%Y-%m-%d %H:%M')}")
+            if self._stop_event.wait((next_time - datetime.now()).total_seconds()):
+                break
+            try:
+                self.refresh_all()
+            except Exception as e:
+                logger.error(f"定时刷新失败：{str(e)}")
+
+    def _make_handler(self):
+        """创建绑定到当前服务的HTTP请求处理器"""
+        service = self
+
+        class SignalRequestHandler(BaseHTTPRequestHandler):
+            """本地信号查询接口"""
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                start_time = time.time()
+
+                if url.path == '/health':
+                    self._send_json(200, {
+                        'status': 'ok',
+                        'cached_funds': len(service.signal_cache),
+                        'last_refresh': service.last_refresh.strftime('%Y-%m-%d %H:%M:%S') if service.last_refresh else None
+                    })
+                    return
+
+                if url.path != '/signals':
+                    self._send_json(404, {'error': f'未知路径：{url.path}'})
+                    return
+
+                codes = params.get('code')
+                if not codes:
+                    # 不指定基金时返回全部缓存基金的最新信号
+                    latest = [
+                        daily_rows(entry['signal_data']).iloc[-1].to_dict()
+                        for entry in list(service.signal_cache.values())
+                        if not daily_rows(entry['signal_data']).empty
+                    ]
+                    self._send_json(200, {'count': len(latest), 'signals': latest})
+                    return
+
+                entry, cached = service.get_signals(codes[0])
+                if entry is None:
+                    self._send_json(404, {'error': f'基金{codes[0]}数据获取失败'})
+                    return
+
+                self._send_json(200, {
+                    'fund_code': entry['fund_code'],
+                    'cached': cached,
+                    'updated_at': entry['updated_at'],
+                    'elapsed_ms': round((time.time() - start_time) * 1000, 2),
+                    'signals': entry['signal_data'].to_dict(orient='records')
+                })
+
+            def log_message(self, format, *args):
+                logger.debug(f"HTTP {self.address_string()} {format % args}")
+
+        return SignalRequestHandler
+
+    def serve_forever(self):
+        """预热缓存，启动定时刷新线程和HTTP服务"""
+        self.refresh_all()
+
+        refresh_thread = threading.Thread(target=self._refresh_loop, name='signal-refresh', daemon=True)
+        refresh_thread.start()
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        logger.info(f"基金信号服务已启动：http://{self.host}:{self.port}/signals?code=110020")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """停止服务"""
+        self._stop_event.set()
+        if self.httpd is not None:
+            self.httpd.server_close()
+            self.httpd = None
+        logger.info("基金信号服务已停止")
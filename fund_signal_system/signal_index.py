@@ -0,0 +1,176 @@
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from logger import logger
+
+
+class SignalIndex:
+    """基金信号状态索引
+
+    每个基金每个指标只保留一条最新信号状态，信号发生变化时追加一条变化记录，
+    用于生成"较上期变化"和查询基金在某段时间内的信号变化，无需回读历史报告文件。
+    """
+
+    # 需要跟踪状态的信号列
+    SIGNAL_COLUMNS = ['均线信号', 'RSI信号', 'macd信号', 'cci信号', '布林带信号']
+
+    def __init__(self, db_path=None):
+        """初始化信号索引，数据库默认位于 data/signal_index.db"""
+        if db_path is None:
+            db_path = os.path.join(os.getcwd(), 'data', 'signal_index.db')
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self._create_tables()
+        logger.info(f"信号索引已加载：{db_path}")
+
+    def _create_tables(self):
+        """创建索引表"""
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signal_state (
+                fund_code TEXT NOT NULL,
+                indicator TEXT NOT NULL,
+                signal TEXT NOT NULL,
+                nav_date TEXT NOT NULL,
+                report_date TEXT NOT NULL,
+                fund_name TEXT,
+                PRIMARY KEY (fund_code, indicator)
+            );
+            CREATE TABLE IF NOT EXISTS signal_transition (
+                fund_code TEXT NOT NULL,
+                indicator TEXT NOT NULL,
+                from_signal TEXT NOT NULL,
+                to_signal TEXT NOT NULL,
+                nav_date TEXT NOT NULL,
+                report_date TEXT NOT NULL,
+                fund_name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_transition_fund_date
+                ON signal_transition (fund_code, nav_date);
+            CREATE INDEX IF NOT EXISTS idx_transition_report
+                ON signal_transition (report_date);
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def normalize_code(fund_code):
+        """去掉基金代码的.OF等后缀，索引中统一使用不带后缀的代码"""
+        return str(fund_code).strip().split('.')[0]
+
+    def update(self, fund_code, signal_df, report_date):
+        """用基金最新一行信号更新索引，返回本次检测到的信号变化列表"""
+        if signal_df is None or signal_df.empty or '净值日期' not in signal_df.columns:
+            return []
+
+        fund_code = self.normalize_code(fund_code)
+        nav_dates = pd.to_datetime(signal_df['净值日期'], errors='coerce')
+        latest_row = signal_df.loc[nav_dates.idxmax()]
+        nav_date = nav_dates.max().strftime('%Y-%m-%d')
+        fund_name = latest_row.get('基金简称')
+
+        stored = {
+            indicator: (signal, stored_date)
+            for indicator, signal, stored_date in self.conn.execute(
+                "SELECT indicator, signal, nav_date FROM signal_state WHERE fund_code = ?",
+                (fund_code,)
+            )
+        }
+
+        changes = []
+        for indicator in self.SIGNAL_COLUMNS:
+            if indicator not in signal_df.columns:
+                continue
+            signal = str(latest_row[indicator])
+            previous = stored.get(indicator)
+
+            if previous is not None:
+                previous_signal, previous_date = previous
+                # 不用更早的净值覆盖已有状态
+                if nav_date < previous_date:
+                    continue
+                if nav_date > previous_date and signal != previous_signal:
+                    self.conn.execute(
+                        "INSERT INTO signal_transition VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (fund_code, indicator, previous_signal, signal, nav_date, report_date, fund_name)
+                    )
+                    changes.append({
+                        '基金代码': fund_code,
+                        '基金简称': fund_name,
+                        '指标': indicator,
+                        '原信号': previous_signal,
+                        '新信号': signal,
+                        '净值日期': nav_date
+                    })
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signal_state VALUES (?, ?, ?, ?, ?, ?)",
+                (fund_code, indicator, signal, nav_date, report_date, fund_name)
+            )
+
+        if changes:
+            logger.info(f"基金{fund_code}信号发生变化：{[(c['指标'], c['原信号'], c['新信号']) for c in changes]}")
+        return changes
+
+    def commit(self):
+        """提交索引更新"""
+        self.conn.commit()
+
+    def rollback(self):
+        """放弃未提交的索引更新"""
+        self.conn.rollback()
+
+    def get_changes(self, report_date):
+        """获取某个报告日期记录的全部信号变化"""
+        return pd.read_sql_query(
+            """
+            SELECT fund_code AS 基金代码, fund_name AS 基金简称, indicator AS 指标,
+                   from_signal AS 原信号, to_signal AS 新信号, nav_date AS 净值日期
+            FROM signal_transition
+            WHERE report_date = ?
+            ORDER BY fund_code, indicator
+            """,
+            self.conn,
+            params=(report_date,)
+        )
+
+    def get_transitions(self, fund_code, start_date=None, end_date=None):
+        """查询基金在日期区间内的信号变化记录"""
+        start_date = start_date or '0000-00-00'
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        return pd.read_sql_query(
+            """
+            SELECT nav_date AS 净值日期, indicator AS 指标,
+                   from_signal AS 原信号, to_signal AS 新信号, report_date AS 报告日期
+            FROM signal_transition
+            WHERE fund_code = ? AND nav_date BETWEEN ? AND ?
+            ORDER BY nav_date, indicator
+            """,
+            self.conn,
+            params=(self.normalize_code(fund_code), start_date, end_date)
+        )
+
+    def get_latest_states(self, fund_code=None):
+        """获取基金各指标的最新信号状态"""
+        query = """
+            SELECT fund_code AS 基金代码, fund_name AS 基金简称, indicator AS 指标,
+                   signal AS 信号, nav_date AS 净值日期, report_date AS 报告日期
+            FROM signal_state
+        """
+        params = ()
+        if fund_code is not None:
+            query += " WHERE fund_code = ?"
+            params = (self.normalize_code(fund_code),)
+        return pd.read_sql_query(query + " ORDER BY fund_code, indicator", self.conn, params=params)
+
+    def latest_nav_dates(self):
+        """获取每个基金已处理的最新净值日期，键为不带后缀的基金代码"""
+        rows = self.conn.execute("SELECT fund_code, MAX(nav_date) FROM signal_state GROUP BY fund_code")
+        return dict(rows.fetchall())
+
+    def close(self):
+        """关闭索引数据库连接"""
+        self.conn.commit()
+        self.conn.close()
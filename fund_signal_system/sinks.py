@@ -0,0 +1,314 @@
+import os
+import pandas as pd
+from openpyxl import Workbook
+from logger import logger
+from correlation import cluster_funds
+from scoring import rank_funds, top_bottom_funds
+from timeframes import daily_rows
+
+
+class SignalSink:
+    """信号输出基类
+
+    run 在分析过程中把每个基金的信号明细（以及近期日增长率序列）交给 write，
+    全部分析结束后按顺序调用 close。
+    close 接收一个共享的 context 字典，前面的输出可以往里写内容供后面的输出使用
+    （例如CSV路径、信号变化），嵌入调用方可以按需组合或自定义输出。
+    全部输出 close 之后再按顺序调用 finish，此时 context 已包含报告邮件是否生成失败（report_failed）。
+    """
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        """写入单个基金的信号明细"""
+        pass
+
+    def close(self, context):
+        """全部基金分析完成后调用"""
+        pass
+
+    def finish(self, context):
+        """全部输出close之后调用"""
+        pass
+
+
+class CsvSink(SignalSink):
+    """CSV信号明细输出"""
+
+    def __init__(self, csv_filename):
+        self.csv_filename = csv_filename
+        self.first_write = True
+        logger.info(f"CSV文件路径：{csv_filename}")
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        """立即写入信号数据到CSV文件"""
+        logger.info(f"开始写入基金{fund_code}信号数据到CSV文件")
+        if self.first_write:
+            # 第一次写入，包含表头
+            signal_df.to_csv(self.csv_filename, index=False, encoding='utf-8-sig')
+            self.first_write = False
+        else:
+            # 后续写入，追加数据，不包含表头
+            signal_df.to_csv(self.csv_filename, index=False, encoding='utf-8-sig', mode='a', header=False)
+        logger.debug(f"基金{fund_code}信号数据已写入CSV文件：{self.csv_filename}")
+
+    def close(self, context):
+        context['csv_path'] = self.csv_filename
+
+
+class ExcelSink(SignalSink):
+    """Excel信号明细输出
+
+    使用openpyxl只写模式逐个基金追加行，结束时一次性保存，
+    避免每个基金都重新读写整个工作簿。
+    """
+
+    def __init__(self, excel_filename):
+        self.excel_filename = excel_filename
+        self.workbook = None
+        self.sheet = None
+        logger.info(f"Excel文件路径：{excel_filename}")
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        """追加信号数据到Excel工作表"""
+        logger.info(f"开始写入基金{fund_code}信号数据到Excel文件")
+        try:
+            if self.workbook is None:
+                self.workbook = Workbook(write_only=True)
+                self.sheet = self.workbook.create_sheet('信号明细')
+                self.sheet.append(list(signal_df.columns))
+
+            rows = signal_df.astype(object).where(signal_df.notna(), None)
+            for row in rows.itertuples(index=False, name=None):
+                self.sheet.append(row)
+            logger.debug(f"基金{fund_code}信号数据已追加到Excel工作表")
+        except Exception as e:
+            logger.error(f"写入Excel文件失败：{str(e)}")
+            logger.debug(f"异常详情：{repr(e)}")
+
+    def close(self, context):
+        if self.workbook is None:
+            return
+        try:
+            self.workbook.save(self.excel_filename)
+            logger.debug(f"信号数据已写入Excel文件：{self.excel_filename}")
+            context['excel_path'] = self.excel_filename
+        except Exception as e:
+            logger.error(f"保存Excel文件失败：{str(e)}")
+            logger.debug(f"异常详情：{repr(e)}")
+        finally:
+            self.workbook = None
+            self.sheet = None
+
+
+class SignalIndexSink(SignalSink):
+    """信号状态索引更新，结束时把本期信号变化放入context
+
+    报告邮件生成后才提交索引；生成失败时回滚，本期的净值和信号变化在下次运行中重新处理。
+    """
+
+    def __init__(self, signal_index, report_date):
+        self.signal_index = signal_index
+        self.report_date = report_date
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        try:
+            # 信号索引只跟踪日线信号
+            self.signal_index.update(fund_code, daily_rows(signal_df), self.report_date)
+        except Exception as e:
+            logger.error(f"更新基金{fund_code}信号索引失败：{str(e)}")
+
+    def close(self, context):
+        # 获取本期信号变化，索引在finish中提交
+        signal_changes = self.signal_index.get_changes(self.report_date)
+        logger.info(f"本期信号变化：{len(signal_changes)}条")
+        context['signal_changes'] = signal_changes
+
+    def finish(self, context):
+        if context.get('report_failed'):
+            logger.warning("报告邮件生成失败，信号索引不提交，下次运行重新处理本期净值")
+            self.signal_index.rollback()
+        else:
+            self.signal_index.commit()
+        self.signal_index.close()
+
+
+class RankingSink(SignalSink):
+    """收集每个基金最新一行的综合评分，结束时按投资类型排名并把前后N名放入context"""
+
+    COLUMNS = ['基金代码', '基金简称', '投资类型', '净值日期', '综合评分', '布林带信号']
+
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self.latest_rows = []
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        signal_df = daily_rows(signal_df)
+        if signal_df.empty or '综合评分' not in signal_df.columns:
+            return
+        latest = signal_df.iloc[-1]
+        self.latest_rows.append({col: latest.get(col) for col in self.COLUMNS})
+
+    def close(self, context):
+        if not self.latest_rows:
+            context['fund_rankings'] = {}
+            return
+        latest_df = pd.DataFrame(self.latest_rows, columns=self.COLUMNS)
+        # 各基金最新净值日期可能不同，这里按投资类型整体排名
+        ranked = rank_funds(latest_df, by_date=False)
+        context['fund_rankings'] = top_bottom_funds(ranked, self.top_n)
+        self.latest_rows = []
+
+
+class ClusterSink(SignalSink):
+    """按日增长率相关性识别持仓相似的基金，结束时把分组结果放入context"""
+
+    def __init__(self, threshold=0.95, memory_budget_mb=256):
+        self.threshold = threshold
+        self.memory_budget_mb = memory_budget_mb
+        self.returns_by_fund = {}
+        self.fund_names = {}
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        if daily_returns is not None:
+            self.returns_by_fund[fund_code] = daily_returns
+        if '基金简称' in signal_df.columns and not signal_df.empty:
+            self.fund_names[fund_code] = signal_df['基金简称'].iloc[-1]
+
+    def close(self, context):
+        try:
+            clusters = cluster_funds(self.returns_by_fund, self.threshold, self.memory_budget_mb)
+        except Exception as e:
+            logger.error(f"基金相关性聚类失败：{str(e)}")
+            clusters = []
+        for cluster in clusters:
+            cluster['names'] = {code: self.fund_names.get(code, f"基金{code}") for code in cluster['members']}
+        context['fund_clusters'] = clusters
+        # 聚类完成后释放收益率序列
+        self.returns_by_fund = {}
+
+
+class EmailSink(SignalSink):
+    """邮件报告同步发送，使用前面输出写入context的CSV路径和信号变化
+
+    默认输出使用OutboxSink经发件箱后台发送；需要在分析流程内直接发送、
+    并通过context['email_sent']得到发送结果时，可以用EmailSink替换OutboxSink。
+    """
+
+    def __init__(self, email_sender, report_date):
+        self.email_sender = email_sender
+        self.report_date = report_date
+
+    def close(self, context):
+        if not context.get('success_count'):
+            logger.error("没有成功分析任何基金，不发送邮件")
+            context['email_sent'] = False
+            return
+
+        if not context.get('csv_path'):
+            logger.error("没有可用的CSV信号明细，无法发送邮件")
+            context['email_sent'] = False
+            return
+
+        # 发送邮件
+        logger.info("开始发送邮件通知")
+        email_sent = self.email_sender.send_email(
+            context['csv_path'],
+            self.report_date,
+            signal_changes=context.get('signal_changes'),
+            fund_clusters=context.get('fund_clusters'),
+            fund_rankings=context.get('fund_rankings'),
+            report_notes=context.get('report_notes')
+        )
+        if email_sent:
+            logger.info("邮件发送成功")
+        else:
+            logger.error("邮件发送失败")
+        context['email_sent'] = email_sent
+
+
+class OutboxSink(SignalSink):
+    """邮件报告写入发件箱，由后台线程发送，分析流程不等待SMTP
+
+    没有自选基金列表的收件人合并收到一封完整报告；
+    配置了自选基金的收件人各自收到只包含自选基金的报告，
+    自选基金的信号明细在写入时留在内存中，不重新读取CSV。
+    """
+
+    def __init__(self, outbox, email_sender, report_date):
+        self.outbox = outbox
+        self.email_sender = email_sender
+        self.report_date = report_date
+        self.watchlists = email_sender.config.get('watchlists', {})
+        self.watched_codes = {code for codes in self.watchlists.values() for code in codes}
+        self.watched_frames = []
+
+    def write(self, fund_code, signal_df, daily_returns=None):
+        # 自选基金代码已去掉.OF等后缀，运行时的基金代码可能带后缀
+        if fund_code.split('.')[0] in self.watched_codes:
+            self.watched_frames.append(signal_df)
+
+    def _filter_context(self, context, codes):
+        """按自选基金过滤信号变化和相似基金分组，综合评分排名保留全市场结果"""
+        signal_changes = context.get('signal_changes')
+        if signal_changes is not None and not signal_changes.empty:
+            signal_changes = signal_changes[signal_changes['基金代码'].isin(codes)]
+        fund_clusters = [cluster for cluster in context.get('fund_clusters') or []
+                         if codes.intersection(code.split('.')[0] for code in cluster['members'])]
+        return signal_changes, fund_clusters
+
+    def close(self, context):
+        context['email_queued'] = 0
+        if not context.get('success_count'):
+            logger.error("没有成功分析任何基金，不发送邮件")
+            return
+        if not self.email_sender.check_config():
+            return
+
+        try:
+            # 完整报告：发给没有配置自选基金的收件人
+            full_recipients = [r for r in self.email_sender.config['recipients'] if r not in self.watchlists]
+            if full_recipients and context.get('csv_path'):
+                csv_path = context['csv_path']
+                with open(csv_path, 'rb') as f:
+                    attachment_bytes = f.read()
+                msg = self.email_sender.build_report_message(
+                    pd.read_csv(csv_path, dtype={'基金代码': str}), self.report_date, full_recipients,
+                    attachment_bytes, os.path.basename(csv_path),
+                    signal_changes=context.get('signal_changes'),
+                    fund_clusters=context.get('fund_clusters'),
+                    fund_rankings=context.get('fund_rankings'),
+                    report_notes=context.get('report_notes')
+                )
+                self.outbox.enqueue(msg, full_recipients)
+                context['email_queued'] += 1
+
+            # 自选基金报告：每个收件人一封
+            watched_df = pd.concat(self.watched_frames, ignore_index=True) if self.watched_frames else pd.DataFrame()
+            for recipient, codes in self.watchlists.items():
+                codes = set(codes)
+                recipient_df = watched_df[watched_df['基金代码'].isin(codes)] if not watched_df.empty else watched_df
+                if recipient_df.empty:
+                    logger.warning(f"收件人{recipient}的自选基金本期没有信号数据，跳过")
+                    continue
+                signal_changes, fund_clusters = self._filter_context(context, codes)
+                msg = self.email_sender.build_report_message(
+                    recipient_df, self.report_date, [recipient],
+                    recipient_df.to_csv(index=False).encode('utf-8-sig'),
+                    f'自选基金信号明细_{self.report_date}.csv',
+                    signal_changes=signal_changes,
+                    fund_clusters=fund_clusters,
+                    fund_rankings=context.get('fund_rankings'),
+                    title="自选基金布林带策略晨报",
+                    report_notes=context.get('report_notes')
+                )
+                self.outbox.enqueue(msg, [recipient])
+                context['email_queued'] += 1
+        except Exception as e:
+            logger.error(f"生成报告邮件失败：{str(e)}")
+            logger.debug(f"异常详情：{repr(e)}")
+            context['report_failed'] = True
+        finally:
+            self.watched_frames = []
+
+        logger.info(f"报告邮件已加入发件箱：{context['email_queued']}封")
+        # 后台发送，不阻塞分析流程
+        self.outbox.start()
@@ -0,0 +1,78 @@
+import os
+import sys
+import logging
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# 内存回归测试：基金数量增加时，run的内存峰值应基本不变
+# 使用合成净值数据和默认输出（含相似基金聚类），不访问网络；未配置SMTP，不发送邮件
+
+for name in ('SMTP_SERVER', 'SMTP_PORT', 'SMTP', 'SMTP_USER', 'SMTP_PASSWORD', 'RECIPIENTS'):
+    os.environ.pop(name, None)
+
+from main import FundSignalAnalyzer
+
+# 日志只输出警告，避免逐基金日志影响测量
+logging.getLogger('fund_analyzer').setLevel(logging.WARNING)
+
+HISTORY_DAYS = 1000
+# 相似基金聚类的内存预算，测试中调小，使预算相对于其他内存占用有意义
+CORR_MEMORY_MB = 16
+
+
+def synthetic_fund_data(fund_code="000001"):
+    """生成与get_fund_data返回结构相同的合成历史净值"""
+    rng = np.random.default_rng(int(fund_code))
+    nav = 1 + np.cumsum(rng.normal(0, 0.01, HISTORY_DAYS))
+    df = pd.DataFrame({
+        '净值日期': pd.bdate_range(end='2026-01-05', periods=HISTORY_DAYS).date,
+        '最新净值': nav
+    })
+    df['日增长率%'] = (df['最新净值'].pct_change() * 100).round(2)
+    df['基金代码'] = fund_code
+    df['基金简称'] = f"基金{fund_code}"
+    return df
+
+
+def measure_peak(fund_count):
+    """用默认输出运行fund_count个基金，返回tracemalloc记录的内存峰值（MB）"""
+    analyzer = FundSignalAnalyzer()
+    analyzer.request_interval = (0, 0)
+    analyzer.force_refresh = True
+    analyzer.get_fund_data = synthetic_fund_data
+    analyzer.corr_memory_mb = CORR_MEMORY_MB
+
+    fund_codes = [f"{i:06d}" for i in range(1, fund_count + 1)]
+
+    tracemalloc.start()
+    analyzer.run(days_to_keep=10, fund_codes=fund_codes, sinks=analyzer.create_default_sinks())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    success = (analyzer.last_run_status['状态'] == '成功').sum()
+    assert success == fund_count, f"成功分析{success}/{fund_count}个基金"
+    return peak / 1024 / 1024
+
+
+try:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        small = measure_peak(20)
+        large = measure_peak(200)
+        print(f"20个基金内存峰值：{small:.1f}MB")
+        print(f"200个基金内存峰值：{large:.1f}MB")
+        print(f"相似基金聚类内存预算：{CORR_MEMORY_MB}MB")
+
+        # 基金数量增加10倍，除相似基金聚类按内存预算分块计算外，峰值增长不应超过50%
+        # （只允许排名、日增长率序列等轻量记录随基金数增长）
+        if large > small * 1.5 + CORR_MEMORY_MB:
+            print("内存回归测试失败：内存峰值随基金数量明显增长")
+            sys.exit(1)
+        print("内存回归测试通过")
+except Exception as e:
+    print(f"测试失败：{str(e)}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
@@ -0,0 +1,74 @@
+import pandas as pd
+from logger import logger
+
+# 支持的周期：代码 -> 周期列中的名称
+TIMEFRAMES = {'D': '日线', 'W': '周线', 'M': '月线'}
+DAILY = TIMEFRAMES['D']
+
+# 周线以周五为周期结束日，月线按自然月
+PERIOD_FREQ = {'W': 'W-FRI', 'M': 'M'}
+
+# 重采样时保留的原始列，其余指标列在各周期上重新计算
+BASE_COLUMNS = ['基金代码', '基金简称', '投资类型', '净值日期', '最新净值']
+
+
+def parse_timeframes(text):
+    """解析周期参数，例如"D,W,M"；日线始终参与计算（信号索引、排名和聚类只使用日线）"""
+    codes = [code.strip().upper() for code in str(text).split(',') if code.strip()]
+    unknown = [code for code in codes if code not in TIMEFRAMES]
+    if unknown:
+        raise ValueError(f"不支持的周期：{unknown}，可选：{list(TIMEFRAMES)}")
+    return ['D'] + [code for code in TIMEFRAMES if code != 'D' and code in codes]
+
+
+def resample_nav(df, timeframe, group_key=None):
+    """把按日期排序的日线净值重采样为周线或月线，每个周期取最后一个净值日的净值
+
+    净值日期保留该周期内实际的最后一个净值日；日增长率%改为相邻周期净值的涨跌幅。
+    group_key不为None时df为多只基金的长表，按该列分别重采样。
+    """
+    periods = pd.to_datetime(df['净值日期']).dt.to_period(PERIOD_FREQ[timeframe])
+    keys = pd.DataFrame({'period': periods.to_numpy()})
+    if group_key is not None:
+        keys['group'] = df[group_key].to_numpy()
+    is_last = ~keys.duplicated(keep='last').to_numpy()
+
+    columns = [col for col in BASE_COLUMNS if col in df.columns]
+    if group_key is not None and group_key not in columns:
+        columns.append(group_key)
+    resampled = df.loc[is_last, columns].reset_index(drop=True)
+
+    nav = pd.to_numeric(resampled['最新净值'], errors='coerce')
+    change = nav.groupby(resampled[group_key]).pct_change() if group_key is not None else nav.pct_change()
+    resampled['日增长率%'] = (change * 100).round(2)
+    resampled['周期'] = TIMEFRAMES[timeframe]
+    return resampled
+
+
+def compute_timeframes(engine, daily_df, timeframes, names=None, group_key=None, min_rows=20):
+    """计算日线以外各周期的指标，返回合并后的长表，没有其他周期时返回None
+
+    各周期（以及批量模式下的各基金）合并成一张长表按分组一次计算，
+    滚动均值、标准差等中间量在一次向量化计算中完成，不需要逐周期重复调用。
+    """
+    frames = [resample_nav(daily_df, timeframe, group_key) for timeframe in timeframes if timeframe != 'D']
+    if not frames:
+        return None
+
+    stacked = pd.concat(frames, ignore_index=True)
+    if group_key is None:
+        stacked['_周期分组'] = stacked['周期']
+    else:
+        stacked['_周期分组'] = stacked[group_key].astype(str) + '|' + stacked['周期']
+    stacked = stacked.sort_values(['_周期分组', '净值日期'], kind='stable').reset_index(drop=True)
+
+    result = engine.compute(stacked, names, group_key='_周期分组', min_rows=min_rows)
+    logger.debug(f"多周期指标计算完成：{stacked['周期'].value_counts().to_dict()}")
+    return result.drop(columns='_周期分组')
+
+
+def daily_rows(signal_df):
+    """取日线信号行；没有周期列时全部为日线"""
+    if signal_df is None or '周期' not in signal_df.columns:
+        return signal_df
+    return signal_df[signal_df['周期'] == DAILY]